@@ -1,17 +1,7 @@
-import os
 import json
 import re
-from groq import Groq
-from dotenv import load_dotenv
 
-load_dotenv()
-
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY not found. Check your .env file.")
-
-client = Groq(api_key=GROQ_API_KEY)
+import llm_gateway
 
 
 def _normalize_text(value):
@@ -134,7 +124,8 @@ def _ensure_structured_body(body, company_name, project_title, project_descripti
 
 
 def generate_newsletter_draft(project_title, project_description,
-                               company_name, company_description):
+                               company_name, company_description, strict=False):
+    """strict=True re-raises generation errors instead of returning a placeholder."""
     try:
         project_title = _normalize_text(project_title)
         project_description = _normalize_text(project_description)
@@ -177,17 +168,15 @@ Guidelines:
 Return STRICT JSON ONLY:
 """
 
-        completion = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[
+        response = llm_gateway.complete(
+            [
                 {"role": "system", "content": "You are an expert B2B email copywriter."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7,
-            max_tokens=400
-        )
-
-        response = completion.choices[0].message.content.strip()
+            max_tokens=400,
+            label="newsletter_draft"
+        ).strip()
 
         parsed = _extract_json_from_text(response)
         subject = ""
@@ -231,6 +220,8 @@ Return STRICT JSON ONLY:
         }
 
     except Exception as e:
+        if strict:
+            raise
         print("Newsletter Generation Error:", repr(e))
         return {
             "subject": "Unable to Generate Email",
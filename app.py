@@ -1,26 +1,37 @@
-
- 
-
-import sqlite3
-import requests
 import re
+import codecs
+import time
+import html as htmllib
 import json # Added for parsing JSON from LLM
-from bs4 import BeautifulSoup
-from flask import Flask, render_template, request, redirect, session, Response, jsonify
-from openpyxl import Workbook
-from groq import Groq # Added Groq import
+from flask import Flask, render_template, request, redirect, session, Response, jsonify, stream_with_context
 import os
+import queue
+import threading
+from urllib.parse import urlparse, parse_qsl
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 from ai_agent import generate_newsletter_draft
-from cross_project_matcher import find_matching_projects
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import cross_project_matcher
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
+import db
+from db import get_db_connection
+from response_cache import ResponseCache
+import http_client
+import jobs
+import migrations
+import company_store
+import relevance
+import industry_analysis
+import llm_gateway
+import chat_memory
+import newsletter_drafts
+import mailer
+import exporter
+import lead_pages
+import project_store
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "leads.db")
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "static", "project_logos")
 
 load_dotenv(os.path.join(BASE_DIR, ".env"))  # Always load env from project folder
@@ -31,6 +42,7 @@ app.secret_key = "tars_stable_system"
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = "login"
+db.init_app(app)
 SERP_API_KEY = os.getenv("SERP_API_KEY")
 
 @app.context_processor
@@ -62,13 +74,6 @@ def inject_active_page():
 
     return dict(active_page=active)
 
-# Initialize Groq Client
-
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-client = Groq(api_key=GROQ_API_KEY)
-def get_db_connection():
-    return sqlite3.connect(DB_PATH)
-
 # ===============================
 # USER MODEL (Flask-Login)
 # ===============================
@@ -81,115 +86,36 @@ class User(UserMixin):
 @login_manager.user_loader
 def load_user(user_id):
 
-    conn = get_db_connection()
+    def load():
+        conn = get_db_connection()
 
-    user = conn.execute(
-        "SELECT id, username FROM users WHERE id=?",
-        (user_id,)
-    ).fetchone()
+        user = conn.execute(
+            "SELECT id, username FROM users WHERE id=?",
+            (user_id,)
+        ).fetchone()
 
-    conn.close()
+        conn.close()
 
-    if user:
-        return User(user[0], user[1])
+        if user:
+            return User(user[0], user[1])
 
-    return None
+        return None
+
+    return db.memo("user", str(user_id), load)
 # ===============================
-# DATABASE INIT (COMPANIES TABLE)
+# DATABASE INIT
 # ===============================
 def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS companies (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        website TEXT,
-        phone TEXT,
-        address TEXT,
-        rating TEXT,
-        chat_id INTEGER
-    )
-    """)
-
-    # Safely add new columns if not exist
-    for col in [
-        "description", "email", "ceo",
-        "company_linkedin", "leadership_linkedin", "status", "reason", "cta_at", "declined_at"
-    ]:
-        try:
-            cur.execute(f"ALTER TABLE companies ADD COLUMN {col} TEXT")
-        except:
-            pass
-    # ensure chat_id exists
-    try:
-        cur.execute("ALTER TABLE companies ADD COLUMN chat_id INTEGER")
-    except:
-        pass
-
-    # Safely add chat_id column
-    try:
-        cur.execute("ALTER TABLE companies ADD COLUMN chat_id INTEGER")
-    except:
-        pass
-
-    
-
-    cur.execute("""
-CREATE TABLE IF NOT EXISTS users (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT UNIQUE,
-    password TEXT
-)
-""")
-    conn.commit()
-    conn.close()
+    """Bring leads.db up to the latest schema (see migrations.py)."""
+    migrations.migrate()
 
 # ===============================
-# CHAT SYSTEM TABLES (NEW)
+# CHAT SYSTEM CLEANUP
 # ===============================
 def init_chat_system():
     conn = get_db_connection()
     cur = conn.cursor()
 
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS chats (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user TEXT,
-        title TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS messages (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        chat_id INTEGER,
-        role TEXT,
-        content TEXT,
-        timestamp DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS products (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        chat_id INTEGER,
-        product_name TEXT,
-        description TEXT,
-        industry TEXT,
-        location TEXT,
-        industry_suggestions TEXT
-    )
-    """)
-
-    # add column safely if missing
-    try:
-        cur.execute("ALTER TABLE products ADD COLUMN industry_suggestions TEXT")
-    except:
-        pass
-
     # cleanup potential test project
     try:
         cur.execute("DELETE FROM chats WHERE title = 'Test'")
@@ -201,41 +127,135 @@ def init_chat_system():
     conn.close()
 
 
-# Run both initializations
+# Run all initializations
 init_db()
 init_chat_system()
 
+# ===============================
+# ENRICHMENT POOL
+# ===============================
+# All per-company enrichment calls run on one bounded pool so a targeting
+# run costs roughly one slow call per batch instead of the sum of them.
+ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", "16"))
+
+enrich_pool = ThreadPoolExecutor(max_workers=ENRICH_WORKERS, thread_name_prefix="enrich")
+
+# Industry searches of every targeting run share one smaller pool; its tasks
+# only wait on enrich_pool (never the other way round), so neither can deadlock.
+TARGETING_WORKERS = int(os.getenv("TARGETING_WORKERS", "4"))
+
+industry_pool = ThreadPoolExecutor(max_workers=TARGETING_WORKERS, thread_name_prefix="industry")
+
 # ===============================
 # WEBSITE SCRAPER
 # ===============================
+# Pages are streamed and scanned with compiled regexes instead of being
+# parsed into a full DOM. Reading stops once </head> has been seen and either
+# an email turned up or SCRAPE_BODY_BYTES of body were scanned.
+SCRAPE_MAX_BYTES = 512 * 1024
+SCRAPE_BODY_BYTES = 96 * 1024
+SCRAPE_CHUNK = 16 * 1024
+
+EMAIL_RE = re.compile(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]+")
+HEAD_END_RE = re.compile(r"</head\s*>", re.I)
+META_TAG_RE = re.compile(r"<meta\b[^>]*>", re.I)
+TAG_ATTR_RE = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+TITLE_RE = re.compile(r"<title\b[^>]*>(.*?)</title\s*>", re.I | re.S)
+
+
+def _meta_description(head):
+    for tag in META_TAG_RE.findall(head):
+        attrs = {
+            m.group(1).lower(): m.group(2) if m.group(2) is not None else (m.group(3) if m.group(3) is not None else m.group(4))
+            for m in TAG_ATTR_RE.finditer(tag)
+        }
+        if attrs.get("name") == "description":
+            return attrs.get("content", "")
+    return None
+
+
 def extract_website_data(url):
     try:
-        html = requests.get(url, timeout=5).text
-        soup = BeautifulSoup(html, "html.parser")
+        with http_client.stream(url, timeout=5) as resp:
+            try:
+                decoder = codecs.getincrementaldecoder(resp.encoding or "utf-8")(errors="replace")
+            except LookupError:
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+            html = ""
+            read = 0
+            head_end = -1
+            email = ""
+
+            for chunk in resp.iter_content(SCRAPE_CHUNK):
+                read += len(chunk)
+                scan_from = max(0, len(html) - 256)  # emails can straddle chunks
+                html += decoder.decode(chunk)
+
+                if not email:
+                    m = EMAIL_RE.search(html, scan_from)
+                    if m:
+                        email = m.group(0)
+
+                if head_end == -1:
+                    m = HEAD_END_RE.search(html, max(0, scan_from - 8))
+                    if m:
+                        head_end = m.start()
+
+                if read >= SCRAPE_MAX_BYTES:
+                    break
+                if head_end != -1 and (email or len(html) - head_end >= SCRAPE_BODY_BYTES):
+                    break
+
+        head = html[:head_end] if head_end != -1 else html
+
+        desc = _meta_description(head)
+        if desc is None:
+            title = TITLE_RE.search(head)
+            desc = title.group(1).strip() if title else ""
+
+        return email, htmllib.unescape(desc)
+    except:
+        return "", ""
 
-        emails = re.findall(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]+", html)
-        email = emails[0] if emails else ""
+# ===============================
+# SERPAPI (CACHED)
+# ===============================
+SERP_URL = os.getenv("SERP_API_URL", "https://serpapi.com/search")
 
-        desc = ""
-        meta = soup.find("meta", attrs={"name": "description"})
-        if meta:
-            desc = meta.get("content", "")
-        elif soup.title:
-            desc = soup.title.text.strip()
+# Keep bursts of enrichment inside the SerpAPI plan's throughput
+http_client.set_rate_limit(SERP_URL, int(os.getenv("SERP_MAX_PER_MINUTE", "120")))
 
-        return email, desc
-    except:
-        return "", ""
+# Maps listings change slowly; organic LinkedIn results a little faster
+serp_cache = ResponseCache(
+    "serp_cache",
+    default_ttl=3 * 86400,
+    ttls={"google_maps": 7 * 86400, "google": 3 * 86400},
+    max_entries=int(os.getenv("SERP_CACHE_MAX_ENTRIES", "20000"))
+)
+
+
+def serp_search(params):
+    """Run a SerpAPI query through the shared cache; params exclude the api key."""
+    def load():
+        return http_client.get(SERP_URL, params={**params, "api_key": SERP_API_KEY}).json()
+
+    return serp_cache.fetch(
+        params.get("engine", "google"),
+        params,
+        load,
+        cacheable=lambda data: "error" not in data
+    )
 
 # ===============================
 # CEO LINKEDIN
 # ===============================
+
 def find_ceo_with_linkedin(company_name):
     try:
         query = f"{company_name} CEO LinkedIn"
 
-        params = {"q": query, "engine": "google", "api_key": SERP_API_KEY}
-        data = requests.get("https://serpapi.com/search", params=params).json()
+        data = serp_search({"q": query, "engine": "google"})
 
         for result in data.get("organic_results", []):
             link = result.get("link", "")
@@ -255,8 +275,7 @@ def find_ceo_with_linkedin(company_name):
 def find_company_and_hr_linkedin(company_name):
     try:
         query = f"{company_name} company LinkedIn"
-        params = {"q": query, "engine": "google", "api_key": SERP_API_KEY}
-        data = requests.get("https://serpapi.com/search", params=params).json()
+        data = serp_search({"q": query, "engine": "google"})
 
         company_linkedin = ""
         leadership_linkedin = ""
@@ -280,164 +299,444 @@ def find_company_and_hr_linkedin(company_name):
 def map_industry_to_search(industry):
     return f"{industry}"
 
-def search_companies_maps(keyword, city):
+# Enrichment older than this is redone when a business turns up again or a
+# project's leads are refreshed; fresher entities are reused as they are.
+ENRICH_MAX_AGE_DAYS = float(os.getenv("ENRICH_MAX_AGE_DAYS", "30"))
+
+
+def enrich_cutoff():
+    """enriched_at values older than this timestamp are stale."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - ENRICH_MAX_AGE_DAYS * 86400))
+
+
+def submit_enrichment(name, website):
+    """Start the website, CEO and LinkedIn lookups for one company on enrich_pool."""
+    return (
+        enrich_pool.submit(extract_website_data, website) if website else None,
+        enrich_pool.submit(find_ceo_with_linkedin, name),
+        enrich_pool.submit(find_company_and_hr_linkedin, name),
+    )
+
+
+def enrichment_result(futures, description=""):
+    """Collect submit_enrichment() futures into the enriched company fields."""
+    site_job, ceo_job, linkedin_job = futures
+    email = ""
+    ceo = "Not Available"
+
+    if site_job:
+        email, desc2 = site_job.result()
+        if not description:
+            description = desc2
+
+    # CEO enrichment
+    ceo_name, ceo_link = ceo_job.result()
+    if ceo_link:
+        ceo = f"{ceo_name}|{ceo_link}"
+
+    # NEW LinkedIn enrichment
+    company_ln, hr_ln = linkedin_job.result()
+
+    return {
+        "description": description,
+        "email": email,
+        "ceo": ceo,
+        "company_linkedin": company_ln,
+        "leadership_linkedin": hr_ln,
+        "enriched_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+    }
+
+
+# Maps returns ~20 listings a page; SerpAPI's pagination link gives the next one
+MAPS_MAX_PAGES = int(os.getenv("MAPS_MAX_PAGES", "5"))
+
+
+def maps_next_params(data):
+    """SerpAPI params for the page after a Maps response, or None on the last page."""
+    next_url = (data.get("serpapi_pagination") or {}).get("next")
+    if not next_url:
+        return None
+    params = dict(parse_qsl(urlparse(next_url).query))
+    params.pop("api_key", None)
+    return params
+
+
+def _maps_result(r):
+    website = r.get("website")
+    if website and not website.startswith("http"):
+        website = "https://" + website
+    return {
+        "name": r.get("title"),
+        "website": website,
+        "phone": r.get("phone", ""),
+        "address": r.get("address", ""),
+        "rating": r.get("rating", ""),
+        "description": r.get("description", ""),
+    }
+
+
+class LeadBudget:
+    """How many more leads a targeting run wants, shared by its industry searches.
+
+    Each business (by entity key, i.e. normalized domain where there is one)
+    is claimed at most once, so parallel industries never enrich or save the
+    same company twice. wanted=None means no limit.
+    """
+
+    def __init__(self, wanted=None):
+        self.remaining = wanted
+        self.seen = set()
+        self.lock = threading.Lock()
+
+    def exhausted(self):
+        return self.remaining is not None and self.remaining <= 0
+
+    def claim(self, candidates):
+        """Reserve [(key, item)] in order; returns the items granted."""
+        granted = []
+        with self.lock:
+            for key, item in candidates:
+                if self.exhausted():
+                    break
+                if key in self.seen:
+                    continue
+                self.seen.add(key)
+                if self.remaining is not None:
+                    self.remaining -= 1
+                granted.append(item)
+        return granted
+
+    def close(self):
+        with self.lock:
+            self.remaining = 0
+
+
+def _new_maps_results(results, chat_id, budget):
+    """[(company, stored entity or None)] for the results budget grants, minus linked ones."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    known = company_store.match_entities(cur, results)
+    linked = company_store.linked_entities(
+        cur, chat_id, [e["id"] for e in known.values()]
+    ) if chat_id else set()
+    conn.close()
+
+    candidates = []
+    for i, c in enumerate(results):
+        entity = known.get(i)
+        if entity:
+            if entity["id"] in linked:
+                continue
+            # merge into the stored entity even if it was keyed differently
+            c["entity_key"] = entity["entity_key"]
+        candidates.append((company_store.key_of(c), (c, entity)))
+    return budget.claim(candidates)
+
+
+def iter_companies_maps(keyword, city, chat_id=None, budget=None):
+    """Yield enriched Maps results page by page, in Maps order.
+
+    Follows SerpAPI's pagination up to MAPS_MAX_PAGES and stops once the
+    LeadBudget is used up (None: no limit); a budget shared between calls
+    also keeps one run from yielding a business twice. With chat_id,
+    businesses already linked to that project are skipped.
+    Businesses already in the global company store (matched on website or
+    phone) are reused as they are unless their enrichment is older than
+    ENRICH_MAX_AGE_DAYS; only new or stale ones are scraped.
+    """
+    budget = budget or LeadBudget()
+    cutoff = enrich_cutoff()
+
     params = {
         "engine": "google_maps",
-        "q": f"{keyword} company in {city}",
-        "api_key": SERP_API_KEY
+        "q": f"{keyword} company in {city}"
     }
+    page_job = None if budget.exhausted() else enrich_pool.submit(serp_search, params)
+    pages = 0
+
+    while page_job:
+        data = page_job.result()
+        pages += 1
+
+        results = [_maps_result(r) for r in data.get("local_results", [])]
+        fresh = _new_maps_results(results, chat_id, budget)
+
+        # fetch the next page while this one is enriched, but only if it will be needed
+        next_params = maps_next_params(data)
+        page_job = None
+        if next_params and pages < MAPS_MAX_PAGES and not budget.exhausted():
+            page_job = enrich_pool.submit(serp_search, next_params)
+
+        # Fan out every enrichment step for the page at once; the steps are
+        # submitted flat (never from inside a pool task) so the pool cannot deadlock.
+        pending = []
+        for c, entity in fresh:
+            if entity and entity["enriched_at"] and entity["enriched_at"] >= cutoff:
+                pending.append((c, entity, None))
+            else:
+                pending.append((c, None, submit_enrichment(c["name"], c["website"])))
+
+        # Yield in the original Maps order so results stay stable
+        for c, entity, enrichment in pending:
+            if entity:
+                yield {
+                    **c,
+                    "description": c["description"] or entity["description"],
+                    "email": entity["email"],
+                    "ceo": entity["ceo"],
+                    "company_linkedin": entity["company_linkedin"],
+                    "leadership_linkedin": entity["leadership_linkedin"]
+                }
+                continue
 
-    data = requests.get("https://serpapi.com/search", params=params).json()
-    companies = []
+            yield {**c, **enrichment_result(enrichment, c["description"])}
 
-    for r in data.get("local_results", []):
-        name = r.get("title")
-        website = r.get("website")
-        phone = r.get("phone", "")
-        address = r.get("address", "")
-        rating = r.get("rating", "")
-        description = r.get("description", "")
 
-        email = ""
-        ceo = "Not Available"
+def refresh_stale_leads(chat_id):
+    """Re-enrich a project's leads whose enrichment is older than ENRICH_MAX_AGE_DAYS.
+
+    Declined leads are left alone. Returns the number of leads refreshed.
+    """
+    conn = get_db_connection()
+    stale = conn.execute("""
+        SELECT e.entity_key, e.name, e.website, e.description
+        FROM project_leads l
+        JOIN company_entities e ON e.id = l.entity_id
+        WHERE l.chat_id = ? AND (l.status IS NULL OR l.status != 'declined')
+          AND (e.enriched_at IS NULL OR e.enriched_at < ?)
+    """, (chat_id, enrich_cutoff())).fetchall()
+    conn.close()
 
-        if website:
-            if not website.startswith("http"):
-                website = "https://" + website
-            email, desc2 = extract_website_data(website)
-            if not description:
-                description = desc2
+    pending = [
+        (key, description, submit_enrichment(name, website))
+        for key, name, website, description in stale
+    ]
 
-        # CEO enrichment
-        ceo_name, ceo_link = find_ceo_with_linkedin(name)
-        if ceo_link:
-            ceo = f"{ceo_name}|{ceo_link}"
+    def refreshed():
+        for key, description, enrichment in pending:
+            yield {"entity_key": key, **enrichment_result(enrichment, description or "")}
 
-        # NEW LinkedIn enrichment
-        company_ln, hr_ln = find_company_and_hr_linkedin(name)
+    save_companies(refreshed(), chat_id, batch_size=5)
+    return len(stale)
 
-        companies.append({
-            "name": name,
-            "website": website,
-            "phone": phone,
-            "address": address,
-            "rating": rating,
-            "description": description,
-            "email": email,
-            "ceo": ceo,
-            "company_linkedin": company_ln,
-            "leadership_linkedin": hr_ln
-        })
 
-    return companies
+def search_companies_maps(keyword, city):
+    return list(iter_companies_maps(keyword, city))
 
 # ===============================
 # DB OPS
 # ===============================
-def clear_companies(chat_id):
+# A targeting run stops searching Maps once a project has this many
+# non-declined leads; projects can set their own target from the dashboard.
+LEAD_THRESHOLD = int(os.getenv("LEAD_THRESHOLD", "30"))
+MAX_LEAD_THRESHOLD = 1000
+
+
+def get_lead_threshold(chat_id):
+    return project_store.lead_threshold(chat_id) or LEAD_THRESHOLD
+
+
+def set_lead_threshold(chat_id, threshold):
     conn = get_db_connection()
-    conn.execute("DELETE FROM companies WHERE chat_id = ?", (chat_id,))
+    conn.execute(
+        "UPDATE chats SET lead_threshold = ? WHERE id = ?",
+        (min(threshold, MAX_LEAD_THRESHOLD), chat_id)
+    )
     conn.commit()
     conn.close()
+    project_store.forget(chat_id)
 
-def save_company(c, chat_id):
 
+def clear_companies(chat_id):
     conn = get_db_connection()
-    conn.execute("""
-INSERT INTO companies
-(name, website, phone, address, rating, description,
- email, ceo, company_linkedin, leadership_linkedin, chat_id)
-VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-""", (
-    c["name"],
-    c["website"],
-    c["phone"],
-    c["address"],
-    c["rating"],
-    c["description"],
-    c.get("email"),
-    c.get("ceo"),
-    c.get("company_linkedin"),
-    c.get("leadership_linkedin"),
-    chat_id      # ⭐ THIS IS THE IMPORTANT PART
-))
+    conn.execute("DELETE FROM project_leads WHERE chat_id = ?", (chat_id,))
     conn.commit()
     conn.close()
 
+def save_companies(companies, chat_id, batch_size=None):
+    """Store company dicts in the global company store and link them to a project.
 
-def get_companies(chat_id):
+    companies may be any iterable (e.g. a generator fed by enrichment); rows
+    are written as they arrive. All rows go in one transaction unless
+    batch_size is set, in which case every batch_size rows are committed.
+    Returns the number of leads newly linked to the project.
+    """
     conn = get_db_connection()
+    cur = conn.cursor()
 
-    rows = conn.execute("""
-    SELECT name, website, phone, address, rating, description,
-           email, ceo, company_linkedin, leadership_linkedin
-    FROM companies
-    WHERE chat_id = ?
-    """, (chat_id,)).fetchall()
+    total = 0
+    batch = []
 
-    conn.close()
+    def flush():
+        nonlocal total
+        ids = company_store.upsert_entities(cur, batch)
+        # link in input order so lead ids follow discovery order
+        total += company_store.link_leads(
+            cur, chat_id, [ids[company_store.key_of(c)] for c in batch]
+        )
+        conn.commit()
+        batch.clear()
+
+    try:
+        for c in companies:
+            batch.append(c)
+            if batch_size and len(batch) >= batch_size:
+                flush()
+
+        if batch:
+            flush()
+    finally:
+        conn.close()
 
-    return [{
-        "name": r[0],
-        "website": r[1],
-        "phone": r[2],
-        "address": r[3],
-        "rating": r[4],
-        "description": r[5],
-        "email": r[6],
-        "ceo": r[7],
-        "company_linkedin": r[8],
-        "leadership_linkedin": r[9]
-    } for r in rows]
+    return total
+
+
+def lead_page_args(args):
+    """lead_pages.page() keyword arguments from a request's query string."""
+    try:
+        min_rating = float(args.get("min_rating") or 0) or None
+    except ValueError:
+        min_rating = None
+    return {
+        "sort": args.get("sort", "added"),
+        "cursor": args.get("cursor"),
+        "status": args.get("status") or None,
+        "has_email": args.get("has_email") in ("1", "true", "on"),
+        "min_rating": min_rating,
+        "limit": args.get("limit", type=int) or lead_pages.PAGE_SIZE,
+    }
 
 
 # ===============================
 # SEARCH EXISTING COMPANIES IN DB
 # ===============================
-def search_existing_companies(city):
+COMPANY_COLUMNS = """c.id, c.name, c.website, c.phone, c.address, c.rating,
+               c.description, c.email, c.ceo, c.company_linkedin, c.leadership_linkedin"""
+
+
+def _fts_terms(text):
+    """Quote each word so user text can never be read as FTS5 syntax."""
+    return [f'"{t}"' for t in re.findall(r"\w+", (text or "").lower())]
+
+
+def search_existing_companies(city, keywords=None, limit=500):
     """
-    Fetch companies already stored in DB that match the selected city.
-    We exclude duplicates by company name.
+    Fetch companies from the global company store that match the selected
+    city, best keyword matches (name/description) first, via the
+    company_entities_fts index. Results are unique per business.
     """
+    city_terms = _fts_terms(city)
+    if not city_terms:
+        return []
+
     conn = get_db_connection()
+    has_fts = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'company_entities_fts'"
+    ).fetchone()
 
-    rows = conn.execute("""
-        SELECT DISTINCT name, website, phone, address, rating,
-               description, email, ceo, company_linkedin, leadership_linkedin
-        FROM companies
-        WHERE address LIKE ?
-    """, (f"%{city}%",)).fetchall()
+    if has_fts:
+        city_query = f"address : ({' '.join(city_terms)})"
+        keyword_terms = [t for k in (keywords or []) for t in _fts_terms(k)]
+
+        queries = []
+        if keyword_terms:
+            queries.append(f"{city_query} AND {{name description}} : ({' OR '.join(keyword_terms)})")
+        queries.append(city_query)
+
+        rows = []
+        for q in queries:
+            rows += conn.execute(f"""
+                SELECT {COMPANY_COLUMNS}
+                FROM company_entities_fts f
+                JOIN company_entities c ON c.id = f.rowid
+                WHERE company_entities_fts MATCH ?
+                ORDER BY bm25(company_entities_fts, 10.0, 5.0, 1.0)
+                LIMIT ?
+            """, (q, limit)).fetchall()
+    else:
+        rows = conn.execute(f"""
+            SELECT {COMPANY_COLUMNS}
+            FROM company_entities c
+            WHERE c.address LIKE ?
+            LIMIT ?
+        """, (f"%{city}%", limit)).fetchall()
 
     conn.close()
 
-    companies = [{
-        "name": r[0],
-        "website": r[1],
-        "phone": r[2],
-        "address": r[3],
-        "rating": r[4],
-        "description": r[5],
-        "email": r[6],
-        "ceo": r[7],
-        "company_linkedin": r[8],
-        "leadership_linkedin": r[9]
-    } for r in rows]
+    companies = []
+    seen = set()
+    for r in rows:
+        if r[0] in seen:
+            continue
+        seen.add(r[0])
+
+        companies.append({
+            "entity_id": r[0],
+            "name": r[1],
+            "website": r[2],
+            "phone": r[3],
+            "address": r[4],
+            "rating": r[5],
+            "description": r[6],
+            "email": r[7],
+            "ceo": r[8],
+            "company_linkedin": r[9],
+            "leadership_linkedin": r[10]
+        })
+
+        if len(companies) >= limit:
+            break
 
     return companies
 
 # ===============================
 # AI RELEVANCE FILTER
 # ===============================
-def filter_relevant_companies(project_description, companies):
+RELEVANCE_TOP_K = int(os.getenv("RELEVANCE_TOP_K", "100"))
+RELEVANCE_MIN_SCORE = float(os.getenv("RELEVANCE_MIN_SCORE", "0.08"))
+RELEVANCE_LLM_RERANK = int(os.getenv("RELEVANCE_LLM_RERANK", "0"))  # 0 = off
+
+
+def filter_relevant_companies(project_description, companies, top_k=RELEVANCE_TOP_K):
+    """
+    Ranks stored companies against the project with the local relevance
+    index (see relevance.py) and returns the best matches, best first.
+    If RELEVANCE_LLM_RERANK is set, only that many top matches are
+    double-checked by the Groq LLM.
+    """
+    if not companies or not (project_description or "").strip():
+        return []
+
+    try:
+        ranked = relevance.rank_entities(
+            project_description,
+            [c.get("entity_id") for c in companies],
+            top_k,
+            RELEVANCE_MIN_SCORE
+        )
+    except Exception as e:
+        print("Relevance filter error:", e)
+        return []
+
+    relevant = [companies[i] for i, _ in ranked]
+
+    if RELEVANCE_LLM_RERANK and relevant:
+        head = relevant[:RELEVANCE_LLM_RERANK]
+        relevant = llm_confirm_relevant(project_description, head) + relevant[RELEVANCE_LLM_RERANK:]
+
+    return relevant
+
+
+def llm_confirm_relevant(project_description, companies):
     """
     Uses Groq LLM to check which companies are relevant to the project.
-    Returns only relevant companies.
+    Returns only relevant companies; on failure the input is kept as-is.
     """
     try:
 
         context = "\n".join([
             f"{c['name']} - {c.get('description','')}"
-            for c in companies[:30]  # limit for token safety
+            for c in companies
         ])
 
         prompt = f"""
@@ -456,30 +755,26 @@ def filter_relevant_companies(project_description, companies):
         ["Apollo Hospital", "HealthPlix"]
         """
 
-        completion = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[{"role": "user", "content": prompt}],
+        response = llm_gateway.complete(
+            [{"role": "user", "content": prompt}],
             temperature=0.2,
-            max_tokens=200
-        )
-
-        response = completion.choices[0].message.content.strip()
+            max_tokens=200,
+            label="relevance_rerank"
+        ).strip()
 
         start = response.find("[")
         end = response.rfind("]") + 1
 
         if start == -1:
-            return []
+            return companies
 
         names = json.loads(response[start:end])
 
-        relevant = [c for c in companies if c["name"] in names]
-
-        return relevant
+        return [c for c in companies if c["name"] in names]
 
     except Exception as e:
-        print("Relevance filter error:", e)
-        return []
+        print("Relevance re-rank error:", e)
+        return companies
 # ===============================
 # INDUSTRY SUGGESTION ENGINE
 # ===============================
@@ -505,18 +800,17 @@ def suggest_industries(description):
         Do not explain. Do not add commentary. Only return the list.
         """
 
-        completion = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[
+        response_text = llm_gateway.complete(
+            [
                 {"role": "system", "content": "You are a helpful assistant that categorizes products into industries for lead generation."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.1, # Low temperature for consistent categorization
-            max_tokens=100
-        )
+            max_tokens=100,
+            label="suggest_industries"
+        ).strip()
 
-        # Extract content and attempt to parse the list
-        response_text = completion.choices[0].message.content.strip()
+        # Attempt to parse the list
         
         # Simple cleanup to handle potential LLM conversational fluff
         start_idx = response_text.find('[')
@@ -562,82 +856,82 @@ def format_chat_html(text):
         out.append('</ul>')
     return '<br>'.join(out)
 
-def chat_html_to_text(content):
-    """Convert stored chat HTML into plain text before sending to the model."""
-    if not content:
-        return ""
-    text = re.sub(r"<br\s*/?>", "\n", content, flags=re.I)
-    text = re.sub(r"</?(ul|ol)\b[^>]*>", "\n", text, flags=re.I)
-    text = re.sub(r"<li\b[^>]*>", "- ", text, flags=re.I)
-    text = re.sub(r"</li>", "\n", text, flags=re.I)
-    text = re.sub(r"<[^>]+>", "", text)
-    import html as _html
-    text = _html.unescape(text)
-    return re.sub(r"\n{3,}", "\n\n", text).strip()
-
 # ===============================
 # CHAT HELPERS (NEW)
 # ===============================
-def generate_sales_ai_reply(chat_id, user_message):
-    try:
-        previous_messages = get_chat_messages(chat_id)
-        product_name, product_description, _ = get_product_info(chat_id)
-
-        conversation = [
-            {
-                "role": "system",
-                "content": (
-                    "You are a highly interactive AI sales strategist and startup advisor. "
-                    "Understand the user's message semantically even when phrased in different words. "
-                    "Use conversation context to give specific, non-repetitive answers. "
-                    "Never act like a rigid form bot and never ask for magic trigger phrases. "
-                    "If details are missing, ask one short follow-up question. "
-                    "Keep responses practical, clear, and conversational."
-                ),
-            }
-        ]
-
-        if product_name or product_description:
-            product_context = (
-                f"Known project context:\n"
-                f"- Product name: {product_name or 'Not provided'}\n"
-                f"- Product description: {product_description or 'Not provided'}"
-            )
-            conversation.append({"role": "system", "content": product_context})
-
-        for role, content, _ in previous_messages[-20:]:
-            if role not in ("user", "assistant", "system"):
-                continue
-            clean_content = chat_html_to_text(content)
-            if clean_content:
-                conversation.append({"role": role, "content": clean_content})
+SALES_AI_FALLBACK = "Tell me a bit more about what you're building and what kind of help you want."
+
+
+def build_sales_conversation(chat_id, user_message):
+    """System prompt, project context, summary + recent history and the new message."""
+    product_name, product_description, _ = get_product_info(chat_id)
+
+    conversation = [
+        {
+            "role": "system",
+            "content": (
+                "You are a highly interactive AI sales strategist and startup advisor. "
+                "Understand the user's message semantically even when phrased in different words. "
+                "Use conversation context to give specific, non-repetitive answers. "
+                "Never act like a rigid form bot and never ask for magic trigger phrases. "
+                "If details are missing, ask one short follow-up question. "
+                "Keep responses practical, clear, and conversational."
+            ),
+        }
+    ]
+
+    if product_name or product_description:
+        product_context = (
+            f"Known project context:\n"
+            f"- Product name: {product_name or 'Not provided'}\n"
+            f"- Product description: {product_description or 'Not provided'}"
+        )
+        conversation.append({"role": "system", "content": product_context})
+
+    conversation.extend(chat_memory.history(chat_id))
 
+    # the streaming route saves the user's message first; don't send it twice
+    last = conversation[-1]
+    if not (last["role"] == "user" and last["content"] == user_message.strip()):
         conversation.append({"role": "user", "content": user_message.strip()})
+    return conversation
 
-        completion = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=conversation,
+
+def generate_sales_ai_reply(chat_id, user_message):
+    try:
+        return llm_gateway.complete(
+            build_sales_conversation(chat_id, user_message),
             temperature=0.5,
             max_tokens=500,
-        )
+            label="sales_chat",
+            cache=False,
+        ).strip()
+    except Exception as e:
+        print("Sales AI Error:", e)
+        return SALES_AI_FALLBACK
 
-        return completion.choices[0].message.content.strip()
+
+def stream_sales_ai_reply(chat_id, user_message):
+    """Yield the reply as it is generated; falls back like generate_sales_ai_reply."""
+    sent = False
+    try:
+        for piece in llm_gateway.stream(
+            build_sales_conversation(chat_id, user_message),
+            temperature=0.5,
+            max_tokens=500,
+            label="sales_chat",
+        ):
+            sent = True
+            yield piece
     except Exception as e:
         print("Sales AI Error:", e)
-        return "Tell me a bit more about what you're building and what kind of help you want."
+        if not sent:
+            yield SALES_AI_FALLBACK
 
 
 def get_product_info(chat_id):
     """Return (product_name, description, industry_suggestions_json) for a chat if present."""
-    conn = get_db_connection()
-    row = conn.execute(
-        "SELECT product_name, description, industry_suggestions FROM products WHERE chat_id=?",
-        (chat_id,)
-    ).fetchone()
-    conn.close()
-    if row:
-        return row[0], row[1], row[2]
-    return None, None, None
+    return project_store.get_product(chat_id)
 
 
 def upsert_product(chat_id, product_name=None, description=None, industry_suggestions=None):
@@ -647,34 +941,41 @@ def upsert_product(chat_id, product_name=None, description=None, industry_sugges
     conn = get_db_connection()
     cur = conn.cursor()
 
-    existing = cur.execute(
-        "SELECT id FROM products WHERE chat_id=?",
-        (chat_id,)
-    ).fetchone()
-
-    if existing:
-        updates = []
-        params = []
-        if product_name is not None:
-            updates.append("product_name=?")
-            params.append(product_name)
-        if description is not None:
-            updates.append("description=?")
-            params.append(description)
-        if industry_suggestions is not None:
-            updates.append("industry_suggestions=?")
-            params.append(industry_suggestions)
-        if updates:
-            params.append(chat_id)
-            cur.execute(f"UPDATE products SET {', '.join(updates)} WHERE chat_id=?", params)
+    updates = []
+    params = []
+    if product_name is not None:
+        updates.append("product_name=?")
+        params.append(product_name)
+    if description is not None:
+        updates.append("description=?")
+        params.append(description)
+    if industry_suggestions is not None:
+        updates.append("industry_suggestions=?")
+        params.append(industry_suggestions)
+
+    # update in place; insert only when the project has no products row yet
+    if updates:
+        params.append(chat_id)
+        existing = cur.execute(f"UPDATE products SET {', '.join(updates)} WHERE chat_id=?", params).rowcount
     else:
+        existing = cur.execute("SELECT 1 FROM products WHERE chat_id=?", (chat_id,)).fetchone()
+
+    if not existing:
         cur.execute(
             "INSERT INTO products (chat_id, product_name, description, industry_suggestions) VALUES (?, ?, ?, ?)",
             (chat_id, product_name or "", description or "", industry_suggestions or "")
         )
 
     conn.commit()
+
     conn.close()
+    project_store.forget(chat_id)
+
+    # keep the cross-project matcher's project vectors current
+    if product_name is not None or description is not None:
+        row = project_store.get_project(chat_id)
+        if row:
+            cross_project_matcher.update_project(row[0], chat_id, row[1], row[2])
 
 
 def user_mentions_project(msg):
@@ -745,11 +1046,13 @@ def create_chat(user, title):
     return chat_id
 
 
-def save_message(chat_id, role, content):
+def save_message(chat_id, role, content, plain=None):
+    """Store a chat message; plain is its text form for prompts (derived if omitted)."""
+    plain = plain if plain is not None else chat_memory.html_to_text(content)
     conn = get_db_connection()
     conn.execute(
-        "INSERT INTO messages (chat_id, role, content) VALUES (?, ?, ?)",
-        (chat_id, role, content)
+        "INSERT INTO messages (chat_id, role, content, plain, tokens) VALUES (?, ?, ?, ?, ?)",
+        (chat_id, role, content, plain, chat_memory.estimate_tokens(plain))
     )
     conn.commit()
     conn.close()
@@ -790,90 +1093,35 @@ def get_chat_messages(chat_id):
 # CROSS-PROJECT INTELLIGENCE (NEW)
 # ===============================
 
+@jobs.register("industry_analysis")
+def run_industry_analysis_job(job_id, payload):
+    """Re-analyze the companies whose inputs changed since the last run."""
+    return industry_analysis.refresh(payload["user"])
+
+
 @app.route("/industry_viewed")
 @login_required
 def industry_viewed():
-   
-    
-    conn = get_db_connection()
-    # Fetch projects and their associated companies
-    # We join chats -> products -> companies
-    data = conn.execute("""
-        SELECT 
-            p.product_name, 
-            p.description, 
-            c.name, 
-            c.description, 
-            c.rating
-        FROM products p
-        JOIN chats ch ON p.chat_id = ch.id
-        LEFT JOIN companies c ON ch.id = c.chat_id
-        WHERE ch.user = ?
-    """,(current_user.username,)).fetchall()
-    conn.close()
+    user = current_user.username
 
-    if not data:
-        return render_template(
-    "industry_viewed.html",
-    analysis="No leads or projects found to analyze yet.",
-    active_page="industry"
-)
+    # Stored results render immediately; changed companies are re-analyzed
+    # in the background and the page reloads once that job finishes.
+    analysis_data = industry_analysis.get_analysis(user)
 
-    # Organize data for the LLM
-    structured_context = {}
-    for p_name, p_desc, comp_name, comp_desc, rating in data:
-        if p_name not in structured_context:
-            structured_context[p_name] = {"desc": p_desc, "leads": []}
-        if comp_name:
-            structured_context[p_name]["leads"].append(f"{comp_name} (Rating: {rating}) - {comp_desc}")
-
-    # Build the text prompt
-    context_text = "Here is the user's sales portfolio and the specific companies they have scraped:\n"
-    for project, info in structured_context.items():
-        context_text += f"\nPROJECT: {project}\nOFFERING: {info['desc']}\nTARGETED COMPANIES:\n"
-        context_text += "\n".join(info['leads'][:10]) # Limit to top 10 leads per project for token space
-        context_text += "\n"
-
-    prompt = f"""
-    Analyze the following sales projects and companies:
-
-    {context_text}
-
-    For each company:
-    - Identify the BEST matching project(s)
-    - Return ONLY valid JSON in this format:
-
-    [
-    {{
-        "company": "Company Name",
-        "projects": ["Project 1", "Project 2"]
-    }}
-    ]
+    refresh_job = None
+    if industry_analysis.needs_refresh(user):
+        refresh_job = jobs.find_active("industry_analysis", user) or \
+            jobs.enqueue("industry_analysis", {"user": user}, user=user)
 
-    Return ONLY JSON. No explanation. No HTML.
-    """
-    
-    try:
-        completion = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
-        )
-        response_text = completion.choices[0].message.content.strip()
-
-        start = response_text.find("[")
-        end = response_text.rfind("]") + 1
+    if not analysis_data and not refresh_job:
+        analysis_data = "No leads or projects found to analyze yet."
 
-        if start != -1 and end != -1:
-            json_text = response_text[start:end]
-            analysis_data = json.loads(json_text)
-        else:
-            analysis_data = []
-    except Exception as e:
-        analysis_data = []
-        print(f"Industry analysis error: {e}")
-
-    return render_template("industry_viewed.html", analysis=analysis_data, active_page="industry")
+    return render_template(
+        "industry_viewed.html",
+        analysis=analysis_data,
+        refresh_job=refresh_job,
+        active_page="industry"
+    )
 
 
 # ===============================
@@ -1026,17 +1274,20 @@ def new_chat():
     title = request.form.get("title", "New Project")
     description = request.form.get("description", "")
 
-    # 1️⃣ Create chat first
-    chat_id = create_chat(current_user.username, title)
+    with db.unit_of_work():
+        # 1️⃣ Create chat first
+        chat_id = create_chat(current_user.username, title)
 
-    # 2️⃣ Save product entry
-    conn = get_db_connection()
-    conn.execute(
-        "INSERT INTO products (chat_id, product_name, description) VALUES (?, ?, ?)",
-        (chat_id, title, description)
-    )
-    conn.commit()
-    conn.close()
+        # 2️⃣ Save product entry
+        conn = get_db_connection()
+        conn.execute(
+            "INSERT INTO products (chat_id, product_name, description) VALUES (?, ?, ?)",
+            (chat_id, title, description)
+        )
+        conn.commit()
+        conn.close()
+
+    cross_project_matcher.update_project(current_user.username, chat_id, title, description)
 
     # 3️⃣ Save uploaded logo
     logo = request.files.get("logo")
@@ -1059,6 +1310,7 @@ def new_chat():
                 conn.close()
             except Exception:
                 pass
+            cross_project_matcher.remove_project(current_user.username, chat_id)
             return "Invalid file type. Only PNG and JPG images are allowed.", 400
 
         # save file with chat_id-based filename preserving extension
@@ -1096,29 +1348,75 @@ def send_message():
     if not message:
         return redirect(f"/chat_session/{chat_id}")
 
-    conn = get_db_connection()
-    row = conn.execute(
-        "SELECT 1 FROM chats WHERE id=? AND user=?",
-        (chat_id, current_user.username)
-    ).fetchone()
-    conn.close()
-    if not row:
+    if not project_store.owned_project(chat_id, current_user.username):
         return redirect("/chat")
 
-    save_message(chat_id, "user", format_chat_html(message))
-
     ai_reply = generate_sales_ai_reply(chat_id, message)
-    save_message(chat_id, "assistant", format_chat_html(ai_reply))
 
-    inds = extract_industries_from_text(ai_reply)
-    if inds:
-        session["suggested_industry"] = inds
-        import json as _json
-        upsert_product(chat_id, industry_suggestions=_json.dumps(inds))
+    # both turns and any suggested industries are written in one commit
+    with db.unit_of_work():
+        save_message(chat_id, "user", format_chat_html(message), message)
+        save_message(chat_id, "assistant", format_chat_html(ai_reply), ai_reply)
+
+        inds = extract_industries_from_text(ai_reply)
+        if inds:
+            session["suggested_industry"] = inds
+            upsert_product(chat_id, industry_suggestions=json.dumps(inds))
+
+    chat_memory.maybe_compact(chat_id, current_user.username)
 
     return redirect(f"/chat_session/{chat_id}")
 
 
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/send_message_stream", methods=["POST"])
+@login_required
+def send_message_stream():
+    """Like /send_message, but streams the reply as Server-Sent Events.
+
+    Events: `token` ({"text"}) per chunk, then `done` ({"html"}) once the
+    reply has been saved.
+    """
+    chat_id = request.form.get("chat_id", type=int)
+    message = request.form.get("message", "").strip()
+    if not chat_id or not message:
+        return jsonify({"error": "Message required"}), 400
+
+    if not project_store.owned_project(chat_id, current_user.username):
+        return jsonify({"error": "Project not found"}), 404
+
+    save_message(chat_id, "user", format_chat_html(message), message)
+    user = current_user.username
+
+    def generate():
+        pieces = []
+        for piece in stream_sales_ai_reply(chat_id, message):
+            pieces.append(piece)
+            yield _sse("token", {"text": piece})
+
+        ai_reply = "".join(pieces).strip()
+        reply_html = format_chat_html(ai_reply)
+        with db.unit_of_work():
+            save_message(chat_id, "assistant", reply_html, ai_reply)
+
+            inds = extract_industries_from_text(ai_reply)
+            if inds:
+                upsert_product(chat_id, industry_suggestions=json.dumps(inds))
+
+        chat_memory.maybe_compact(chat_id, user)
+
+        yield _sse("done", {"html": reply_html})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.route("/delete_project/<int:chat_id>", methods=["POST"])
 @login_required
 def delete_project(chat_id):
@@ -1129,13 +1427,17 @@ def delete_project(chat_id):
 
     # Delete related data first (to avoid orphan records)
     cur.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+    cur.execute("DELETE FROM chat_summaries WHERE chat_id = ?", (chat_id,))
+    cur.execute("DELETE FROM newsletter_drafts WHERE chat_id = ?", (chat_id,))
     cur.execute("DELETE FROM products WHERE chat_id = ?", (chat_id,))
-    cur.execute("DELETE FROM companies WHERE chat_id = ?", (chat_id,))
+    cur.execute("DELETE FROM project_leads WHERE chat_id = ?", (chat_id,))
     cur.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
 
     conn.commit()
     conn.close()
 
+    cross_project_matcher.remove_project(current_user.username, chat_id)
+
     # Delete logo file if exists
     logo_path = os.path.join(UPLOAD_FOLDER, f"{chat_id}.png")
     if os.path.exists(logo_path):
@@ -1147,18 +1449,104 @@ def delete_project(chat_id):
 # ===============================
 # RUN TARGETING (FROM DASHBOARD BUTTON)
 # ===============================
-@app.route("/run_targeting", methods=["POST"])
-@login_required
-def run_targeting():
-    
+def _search_industry(industry, city, chat_id, budget, out):
+    """industry_pool task: put (industry, company, None) per result, then (industry, None, summary)."""
+    started = time.monotonic()
+    found = 0
+    status = "done"
+    try:
+        if budget.exhausted():
+            status = "skipped"
+        else:
+            for c in iter_companies_maps(map_industry_to_search(industry), city, chat_id=chat_id, budget=budget):
+                out.put((industry, c, None))
+                found += 1
+    except Exception as e:
+        print(f"Maps search error ({industry}):", e)
+        status = "failed"
 
-    selected_industries = request.form.getlist("industry[]")
-    city = request.form["city"]
+    out.put((industry, None, {
+        "status": status,
+        "leads": found,
+        "seconds": round(time.monotonic() - started, 2)
+    }))
 
-    chat_id = session.get("active_chat")
 
-    # clear previous project leads
-    clear_companies(chat_id)
+def harvest_industries(job_id, progress, chat_id, city, budget):
+    """Search every industry in progress["industries"] in parallel; returns new leads saved.
+
+    The searches run on industry_pool and draw from one LeadBudget, so they
+    stop together once the project's threshold is met and a business listed
+    under two industries is claimed by only one. Their results are merged
+    into a single stream that this thread saves in small batches; each
+    industry's lead count and wall time end up in its progress entry, and
+    progress["leads"] is kept current as rows are saved.
+    """
+    out = queue.Queue()
+    for ind in progress["industries"]:
+        progress["industries"][ind]["status"] = "running"
+        industry_pool.submit(_search_industry, ind, city, chat_id, budget, out)
+    jobs.update_progress(job_id, progress)
+
+    def merged():
+        running = len(progress["industries"])
+        while running:
+            ind, company, summary = out.get()
+            if summary:
+                running -= 1
+                progress["industries"][ind] = summary
+                jobs.update_progress(job_id, progress)
+                continue
+
+            progress["industries"][ind]["leads"] += 1
+            yield company
+            # resumed once save_companies took the row; every 5th closes a committed batch
+            progress["leads"] += 1
+            if progress["leads"] % 5 == 0:
+                jobs.update_progress(job_id, progress)
+
+    saved_before = progress["leads"]
+    try:
+        saved = save_companies(merged(), chat_id, batch_size=5)
+    finally:
+        # stop the searches if saving failed part-way
+        budget.close()
+    progress["leads"] = saved_before + saved
+    return saved
+
+
+@jobs.register("targeting")
+def run_targeting_job(job_id, payload):
+    """Background lead hunt for one project; progress is polled via /jobs/<id>.
+
+    payload["mode"] is "incremental" (default): existing leads and their
+    qualification are kept, stale ones are re-enriched and only new
+    companies are added. "replace" clears the project's leads first.
+    Maps search runs for all industries at once until the project holds its
+    lead threshold of non-declined leads (see harvest_industries).
+    """
+    chat_id = payload["chat_id"]
+    city = payload["city"]
+    selected_industries = payload["industries"]
+    mode = payload.get("mode", "incremental")
+
+    progress = {
+        "stage": "database",
+        "leads": 0,
+        "refreshed": 0,
+        "industries": {ind: {"status": "pending", "leads": 0} for ind in selected_industries}
+    }
+    jobs.update_progress(job_id, progress)
+
+    if mode == "replace":
+        # clear previous project leads
+        clear_companies(chat_id)
+    else:
+        progress["stage"] = "refresh"
+        jobs.update_progress(job_id, progress)
+        progress["refreshed"] = refresh_stale_leads(chat_id)
+        progress["stage"] = "database"
+        jobs.update_progress(job_id, progress)
 
     # get project description
     product_name, project_description, _ = get_product_info(chat_id)
@@ -1166,13 +1554,16 @@ def run_targeting():
     # ----------------------------
     # STEP 1: SEARCH EXISTING DB
     # ----------------------------
-    db_companies = search_existing_companies(city)
+    db_companies = search_existing_companies(city, selected_industries)
 
     print("DB companies found:", len(db_companies))
 
     # ----------------------------
     # STEP 2: AI FILTER
     # ----------------------------
+    progress["stage"] = "filter"
+    jobs.update_progress(job_id, progress)
+
     relevant_companies = filter_relevant_companies(
         project_description or "",
         db_companies
@@ -1180,34 +1571,84 @@ def run_targeting():
 
     print("Relevant DB companies:", len(relevant_companies))
 
-    for c in relevant_companies:
-        save_company(c, chat_id)
+    progress["leads"] = save_companies(relevant_companies, chat_id)
 
     # ----------------------------
-    # STEP 3: SERP SEARCH IF NEEDED
+    # STEP 3: SERP SEARCH UNTIL THE PROJECT HAS ENOUGH LEADS
     # ----------------------------
-    lead_threshold = 30
+    threshold = get_lead_threshold(chat_id)
+    progress["threshold"] = threshold
+    progress["stage"] = "maps"
 
-    current_leads = len(relevant_companies)
+    budget = LeadBudget(threshold - project_store.lead_count(chat_id))
+    if budget.exhausted():
+        for ind in selected_industries:
+            progress["industries"][ind]["status"] = "skipped"
+    else:
+        harvest_industries(job_id, progress, chat_id, city, budget)
 
-    if current_leads < lead_threshold:
+    timings = {ind: p.get("seconds") for ind, p in progress["industries"].items()}
+    print("Industry timings (s):", timings)
 
-        for ind in selected_industries:
+    progress["stage"] = "done"
+    jobs.update_progress(job_id, progress)
 
-            search_keyword = map_industry_to_search(ind)
+    return {"leads": progress["leads"], "refreshed": progress["refreshed"], "timings": timings}
 
-            companies = search_companies_maps(search_keyword, city)
 
-            for c in companies:
-                save_company(c, chat_id)
+@app.route("/run_targeting", methods=["POST"])
+@login_required
+def run_targeting():
+    
+
+    selected_industries = request.form.getlist("industry[]")
+    city = request.form["city"]
+
+    chat_id = session.get("active_chat")
+    if not chat_id:
+        return redirect("/dashboard")
+
+    try:
+        threshold = int(request.form.get("lead_threshold") or 0)
+    except ValueError:
+        threshold = 0
+    if threshold > 0:
+        set_lead_threshold(chat_id, threshold)
+
+    job_id = jobs.enqueue(
+        "targeting",
+        {
+            "chat_id": chat_id,
+            "city": city,
+            "industries": selected_industries,
+            "mode": "replace" if request.form.get("replace") else "incremental",
+        },
+        user=current_user.username,
+        chat_id=chat_id
+    )
 
     session["selected_city"] = city
     session["suggested_industry"] = selected_industries
+    session["targeting_job"] = job_id
 
     return redirect("/dashboard")
 
 
+@app.route("/cache_stats")
+@login_required
+def cache_stats():
+    return jsonify({"serp": serp_cache.stats(), "llm": llm_gateway.stats()})
+
+
+@app.route("/jobs/<int:job_id>")
+@login_required
+def job_status(job_id):
+    job = jobs.get_job(job_id)
+    if not job or job["user"] != current_user.username:
+        return jsonify({"error": "Job not found"}), 404
 
+    job.pop("user")
+    return jsonify(job)
 
 
 # ===============================
@@ -1219,18 +1660,9 @@ def dashboard():
     
 
     chat_id = session.get("active_chat")
-    companies = get_companies(chat_id) if chat_id else []
+    leads = lead_pages.page(chat_id) if chat_id else {"leads": [], "next": None}
 
-    # load projects list
-    conn = get_db_connection()
-    projects = conn.execute("""
-        SELECT ch.id, ch.title, p.description
-        FROM chats ch
-        LEFT JOIN products p ON ch.id = p.chat_id
-        WHERE ch.user = ?
-        ORDER BY ch.id DESC
-    """, (current_user.username,)).fetchall()
-    conn.close()
+    projects = project_store.user_projects(current_user.username)
 
     suggested = []
     city = ""
@@ -1245,32 +1677,47 @@ def dashboard():
         
 
     city = session.get("selected_city", "")
+    threshold = get_lead_threshold(chat_id) if chat_id else LEAD_THRESHOLD
+
+    # keep polling the last targeting run until it settles
+    job_id = session.get("targeting_job")
+    if job_id:
+        job = jobs.get_job(job_id)
+        if not job or job["chat_id"] != chat_id or job["status"] in ("done", "failed"):
+            job_id = None
 
     return render_template(
         "dashboard.html",
-        companies=companies,
+        leads=leads,
         suggested_industry=suggested,
         city=city,
+        lead_threshold=threshold,
         projects=projects,   # ⭐ NEW
         active_chat=chat_id, 
+        targeting_job=job_id,
         active_page="dashboard"
     )
 
 
+@app.route("/leads/<int:chat_id>")
+@login_required
+def leads_page(chat_id):
+    """JSON page of a project's leads for the lazily loaded lead tables."""
+    if not project_store.owned_project(chat_id, current_user.username):
+        return jsonify({"error": "Project not found"}), 404
+
+    try:
+        return jsonify(lead_pages.page(chat_id, **lead_page_args(request.args)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
 @app.route("/savedprojects")
 @login_required
 def saved_projects():
     
 
-    conn = get_db_connection()
-    rows = conn.execute("""
-        SELECT ch.id, ch.title, p.description
-        FROM chats ch
-        LEFT JOIN products p ON ch.id = p.chat_id
-        WHERE ch.user = ?
-        ORDER BY ch.id DESC
-    """, (current_user.username,)).fetchall()
-    conn.close()
+    rows = project_store.user_projects(current_user.username)
 
     return render_template("savedprojects.html", chats=rows, active_page="product")
 
@@ -1301,81 +1748,31 @@ def export_excel(chat_id=None):
             </script>
         """
 
-    companies = get_companies(chat_id)
-
-    conn = get_db_connection()
-    row = conn.execute(
-        "SELECT title FROM chats WHERE id=? AND user=?",
-        (chat_id, current_user.username)
-    ).fetchone()
-    conn.close()
-
-    if not row:
+    project = project_store.owned_project(chat_id, current_user.username)
+    if not project:
         return redirect("/dashboard")
 
-    title = row[0]
-
-    # Always create a fresh workbook — one file per project per download
-    wb = Workbook()
-    if "Sheet" in wb.sheetnames:
-        del wb["Sheet"]
-
-    ws = wb.create_sheet(title=title[:30])
+    title = project[1]
 
-    ws.append([
-        "Company","Website","Phone","Address","Rating",
-        "Description","Email","CEO","Company LinkedIn","Leadership LinkedIn"
-    ])
+    # ?format=xlsx (default) | csv | parquet — streamed, nothing touches disk
+    fmt = request.args.get("format", "xlsx").lower()
+    if fmt not in exporter.available_formats():
+        return f"Export format '{fmt}' is not available.", 400
 
-    for c in companies:
-        ws.append(list(c.values()))
+    filename = re.sub(r'[^\w\- ]', "_", title).strip() or "project"
 
-    file_path = f"leads_{chat_id}.xlsx"
-    wb.save(file_path)
-
-    return Response(open(file_path, "rb"),
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment;filename={title}_leads.xlsx"})
+    return Response(
+        stream_with_context(exporter.stream(fmt, chat_id, title)),
+        mimetype=exporter.FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}_leads.{fmt}"'}
+    )
 
 @app.route("/call_for_action")
 @login_required
 def call_for_action():
     
 
-    conn = get_db_connection()
-    rows = conn.execute("""
-        SELECT ch.id, ch.title, p.description
-        FROM chats ch
-        LEFT JOIN products p ON ch.id = p.chat_id
-        WHERE ch.user = ?
-        ORDER BY ch.id DESC
-    """,(current_user.username,)).fetchall()
-
-    projects = []
-    for chat_id, title, description in rows:
-        company_rows = conn.execute("""
-            SELECT name, description, rating, email, phone, address, website
-            FROM companies
-            WHERE chat_id = ? AND status = 'cta'
-            ORDER BY id DESC
-        """, (chat_id,)).fetchall()
-
-        if company_rows:
-            projects.append({
-                "title": title,
-                "description": description,
-                "companies": [{
-                    "name": c[0],
-                    "description": c[1],
-                    "rating": c[2],
-                    "email": c[3],
-                    "phone": c[4],
-                    "address": c[5],
-                    "website": c[6]
-                } for c in company_rows]
-            })
-
-    conn.close()
+    projects = project_store.cta_leads_by_project(current_user.username)
 
     return render_template(
     "call_for_action.html",
@@ -1393,15 +1790,7 @@ def logout():
 def overview():
    
 
-    conn = get_db_connection()
-    rows = conn.execute("""
-        SELECT ch.id, ch.title, p.description
-        FROM chats ch
-        LEFT JOIN products p ON ch.id = p.chat_id
-        WHERE ch.user = ?
-        ORDER BY ch.id DESC
-    """,(current_user.username,)).fetchall()
-    conn.close()
+    rows = project_store.user_projects(current_user.username)
 
     return render_template("overview.html", projects=rows, active_page="overview")
 
@@ -1411,24 +1800,8 @@ def overview():
 def overview_project(chat_id):
    
 
-    conn = get_db_connection()
-
-    # In overview_project(), change the companies query:
-    companies = conn.execute("""
-    SELECT c.id, c.name, c.website, c.phone, c.address, c.rating,
-           c.description, c.email, c.ceo,
-           c.company_linkedin, c.leadership_linkedin, c.status, c.reason
-    FROM companies c
-    JOIN chats ch ON c.chat_id = ch.id
-    WHERE c.chat_id = ? AND ch.user = ?
-    ORDER BY 
-        CASE WHEN c.status='cta' THEN 0 WHEN c.status='declined' THEN 1 ELSE 2 END ASC,
-        CASE WHEN c.status='cta' THEN c.cta_at END DESC NULLS LAST,
-        CASE WHEN c.status='declined' THEN c.declined_at END DESC NULLS LAST,
-        c.id ASC
-""", (chat_id, current_user.username)).fetchall()
-
-    conn.close()
+    owned = project_store.owned_project(chat_id, current_user.username)
+    leads = lead_pages.page(chat_id, sort="status") if owned else {"leads": [], "next": None}
 
     # load product info so we can show suggested industries in the view
     pname, pdesc, stored = get_product_info(chat_id)
@@ -1441,7 +1814,7 @@ def overview_project(chat_id):
 
     return render_template(
         "overview_project.html",
-        companies=companies,
+        leads=leads,
         chat_id=chat_id,
         product_name=pname,
         product_description=pdesc,
@@ -1458,17 +1831,17 @@ def update_status():
     conn = get_db_connection()
     if status == "cta":
      conn.execute(
-        "UPDATE companies SET status=?, reason=?, cta_at=CURRENT_TIMESTAMP WHERE id=?",
+        "UPDATE project_leads SET status=?, reason=?, cta_at=CURRENT_TIMESTAMP WHERE id=?",
         (status, reason, company_id)
     )
     elif status == "declined":
      conn.execute(
-        "UPDATE companies SET status=?, reason=?, declined_at=CURRENT_TIMESTAMP WHERE id=?",
+        "UPDATE project_leads SET status=?, reason=?, declined_at=CURRENT_TIMESTAMP WHERE id=?",
         (status, reason, company_id)
     )
     else:
      conn.execute(
-        "UPDATE companies SET status=?, reason=? WHERE id=?",
+        "UPDATE project_leads SET status=?, reason=? WHERE id=?",
         (status, reason, company_id)
     )
     conn.commit()
@@ -1495,65 +1868,98 @@ def generate_newsletter():
 
     return jsonify(result)
 
+@app.route("/newsletter_batch", methods=["POST"])
+@login_required
+def newsletter_batch():
+    """Queue drafts for a project's whole CTA list (or selected lead ids)."""
+    data = request.get_json(silent=True) or request.form
+    chat_id = data.get("chat_id")
+    lead_ids = data.get("lead_ids") or []
+
+    try:
+        chat_id = int(chat_id) if chat_id is not None else None
+        lead_ids = [int(i) for i in lead_ids]
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid chat_id or lead_ids"}), 400
+
+    if chat_id is None and not lead_ids:
+        return jsonify({"error": "chat_id or lead_ids required"}), 400
+
+    job_id, queued = newsletter_drafts.create_batch(current_user.username, chat_id, lead_ids)
+    return jsonify({"job_id": job_id, "queued": queued})
+
+
+@app.route("/newsletter_drafts/<int:chat_id>")
+@login_required
+def newsletter_drafts_list(chat_id):
+    return jsonify(newsletter_drafts.list_drafts(current_user.username, chat_id))
+
+
+@app.route("/newsletter_drafts/retry/<int:draft_id>", methods=["POST"])
+@login_required
+def newsletter_draft_retry(draft_id):
+    job_id = newsletter_drafts.retry(current_user.username, draft_id)
+    if job_id is None:
+        return jsonify({"error": "Draft not found or not failed"}), 404
+    return jsonify({"job_id": job_id})
+
+
 @app.route("/send_newsletter", methods=["POST"])
 @login_required
 def send_newsletter():
-    
-    
-    try:
-        data = request.get_json()
-        recipient_email = data.get("recipient_email")
-        subject = data.get("subject")
-        body = data.get("body")
-        company_name = data.get("company_name", "")
-        
-        if not recipient_email or not subject or not body:
-            return jsonify({"success": False, "message": "Missing required fields"}), 400
-        
-        # Get SMTP configuration from environment variables
-        smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        sender_email = os.getenv("SENDER_EMAIL")
-        sender_password = os.getenv("SENDER_PASSWORD")
-        
-        if not sender_email or not sender_password:
-            return jsonify({
-                "success": False, 
-                "message": "Email configuration not set. Please configure SMTP settings in .env file."
-            }), 500
-        
-        # Create message
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = subject
-        msg["From"] = sender_email
-        msg["To"] = recipient_email
-        
-        # Create plain text and HTML versions
-        text_part = MIMEText(body, "plain")
-        msg.attach(text_part)
-        
-        # Send email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
-        
-        return jsonify({
-            "success": True, 
-            "message": f"Newsletter sent successfully to {company_name} ({recipient_email})!"
-        })
-        
-    except smtplib.SMTPAuthenticationError:
+    """Queue the email in the outbox; the mailer worker delivers it."""
+    data = request.get_json(silent=True) or {}
+    recipient_email = data.get("recipient_email")
+    subject = data.get("subject")
+    body = data.get("body")
+    company_name = data.get("company_name", "")
+
+    if not recipient_email or not subject or not body:
+        return jsonify({"success": False, "message": "Missing required fields"}), 400
+
+    if not mailer.is_configured():
         return jsonify({
-            "success": False, 
-            "message": "Email authentication failed. Please check your email credentials."
+            "success": False,
+            "message": "Email configuration not set. Please configure SMTP settings in .env file."
         }), 500
-    except Exception as e:
+
+    outbox_id = mailer.enqueue(current_user.username, recipient_email, subject, body, company_name)
+
+    return jsonify({
+        "success": True,
+        "outbox_id": outbox_id,
+        "message": f"Newsletter queued for {company_name} ({recipient_email})."
+    })
+
+
+@app.route("/send_drafts/<int:chat_id>", methods=["POST"])
+@login_required
+def send_drafts(chat_id):
+    """Queue every finished draft of a project for delivery."""
+    if not mailer.is_configured():
         return jsonify({
-            "success": False, 
-            "message": f"Failed to send email: {str(e)}"
+            "success": False,
+            "message": "Email configuration not set. Please configure SMTP settings in .env file."
         }), 500
 
+    queued = mailer.enqueue_drafts(current_user.username, chat_id)
+    return jsonify({"success": True, "queued": queued})
+
+
+@app.route("/outbox/<int:outbox_id>")
+@login_required
+def outbox_status(outbox_id):
+    status = mailer.get_status(current_user.username, outbox_id)
+    if not status:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(status)
+
+
+@app.route("/outbox/project/<int:chat_id>")
+@login_required
+def outbox_project(chat_id):
+    return jsonify(mailer.counts(current_user.username, chat_id))
+
 @app.route("/get_company_project_matches")
 @login_required
 def get_company_project_matches():
@@ -1575,29 +1981,27 @@ def get_company_project_matches():
 
     company_name, company_description = company
 
-    # Get all projects of this user
-    projects = conn.execute("""
-        SELECT ch.title, p.description
-        FROM chats ch
-        LEFT JOIN products p ON ch.id = p.chat_id
-        WHERE ch.user = ?
-
-        ORDER BY ch.id DESC
-""", (current_user.username,)).fetchall()
-
     conn.close()
 
-    matches = find_matching_projects(
+    # Get all projects of this user
+    projects = project_store.user_projects(current_user.username)
+
+    matches = cross_project_matcher.match_company(
+    current_user.username,
+    int(company_id),
     company_name,
     company_description or "",
     projects
 )
 
 # Filter to only return project titles that exist in user's actual projects
-    valid_titles = [p[0] for p in projects]
+    valid_titles = [p[1] for p in projects]
     matches = [m for m in matches if m in valid_titles]
 
     return jsonify(matches)
 
+jobs.start_workers(int(os.getenv("JOB_WORKERS", "2")))
+mailer.start_worker()
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+# Usage:
+#   python bench/bench_save_companies.py [rows ...]
+#
+# Rows/second for storing a targeting run's companies: the old per-row
+# helper (one INSERT and one commit per company) against save_companies(),
+# which writes every row with executemany in one transaction. The per-row
+# helper is timed twice: opening a plain sqlite3 connection per row, as it
+# did when it was replaced, and on today's shared connection from db.py.
+# All variants write the current schema (company_entities upsert plus
+# project_leads link), each run into a fresh project with new companies.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+os.environ.setdefault("GROQ_API_KEY", "bench")
+
+import db  # noqa: E402
+
+# never touch the real leads.db; importing app runs the migrations
+db.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_"), "leads.db")
+
+import app  # noqa: E402
+import company_store  # noqa: E402
+from db import get_db_connection  # noqa: E402
+
+
+def save_company(c, chat_id, connect=get_db_connection):
+    """The per-row pattern save_companies replaced, on today's tables."""
+    conn = connect()
+    cur = conn.cursor()
+    ids = company_store.upsert_entities(cur, [c])
+    company_store.link_leads(cur, chat_id, list(ids.values()))
+    conn.commit()
+    conn.close()
+
+
+def _plain_connection():
+    return sqlite3.connect(db.DB_PATH)
+
+
+def make_companies(prefix, n):
+    return [{
+        "name": f"{prefix} Company {i}",
+        "website": f"https://{prefix}-{i}.example.com",
+        "phone": f"+91 20 {i:08d}",
+        "address": f"{i} FC Road, Pune",
+        "rating": "4.5",
+        "description": "Bench company",
+        "email": f"info@{prefix}-{i}.example.com",
+        "ceo": "Not Available",
+        "company_linkedin": "",
+        "leadership_linkedin": "",
+    } for i in range(n)]
+
+
+def rows_per_second(label, rows, save):
+    chat_id = app.create_chat("bench", f"{label} {rows}")
+    companies = make_companies(f"{label}{rows}", rows)
+
+    start = time.perf_counter()
+    save(companies, chat_id)
+    elapsed = time.perf_counter() - start
+
+    conn = get_db_connection()
+    stored = conn.execute("SELECT COUNT(*) FROM project_leads WHERE chat_id = ?", (chat_id,)).fetchone()[0]
+    conn.close()
+    assert stored == rows, f"{label}: stored {stored} of {rows}"
+    return rows / elapsed
+
+
+def per_row_new_connection(companies, chat_id):
+    for c in companies:
+        save_company(c, chat_id, connect=_plain_connection)
+
+
+def per_row_shared_connection(companies, chat_id):
+    for c in companies:
+        save_company(c, chat_id)
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [500, 5000]
+
+    print(f"{'rows':>7} {'per-row, new conn':>18} {'per-row, shared':>16} {'bulk':>10}   rows/s")
+    for rows in sizes:
+        fresh = rows_per_second("fresh", rows, per_row_new_connection)
+        shared = rows_per_second("shared", rows, per_row_shared_connection)
+        bulk = rows_per_second("bulk", rows, app.save_companies)
+        print(f"{rows:>7} {fresh:>18,.0f} {shared:>16,.0f} {bulk:>10,.0f}"
+              f"   bulk is {bulk / fresh:.1f}x / {bulk / shared:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
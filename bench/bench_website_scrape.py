@@ -0,0 +1,130 @@
+import os
+import re
+import sys
+import statistics
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from bs4 import BeautifulSoup
+
+# Usage:
+#   python bench/bench_website_scrape.py [runs]
+#
+# Compares extract_website_data() with the BeautifulSoup version it replaced
+# on the saved pages in bench/pages/, served from a local HTTP server. Each
+# page is also padded (filler paragraphs at its <!--pad--> marker) to a few
+# realistic sizes, since the streaming reader's advantage grows with the page.
+# Prints the median time per call and whether both return the same result.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES_DIR = os.path.join(ROOT, "bench", "pages")
+PAD_SIZES = [0, 100 * 1024, 500 * 1024, 2 * 1024 * 1024]
+FILLER = "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor.</p>\n"
+
+sys.path.insert(0, ROOT)
+os.environ.setdefault("GROQ_API_KEY", "bench")
+
+import db  # noqa: E402
+
+# never touch the real leads.db; importing app runs the migrations
+db.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_"), "leads.db")
+
+import app  # noqa: E402
+import http_client  # noqa: E402
+
+
+def old_extract_website_data(url):
+    """extract_website_data as it was before streaming (full download + DOM)."""
+    try:
+        html = http_client.get(url, timeout=5).text
+        soup = BeautifulSoup(html, "html.parser")
+
+        emails = re.findall(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]+", html)
+        email = emails[0] if emails else ""
+
+        desc = ""
+        meta = soup.find("meta", attrs={"name": "description"})
+        if meta:
+            desc = meta.get("content", "")
+        elif soup.title:
+            desc = soup.title.text.strip()
+
+        return email, desc
+    except:
+        return "", ""
+
+
+def load_pages():
+    pages = {}
+    for name in sorted(os.listdir(PAGES_DIR)):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(PAGES_DIR, name), encoding="utf-8") as f:
+            html = f.read()
+        for size in PAD_SIZES:
+            if size and "<!--pad-->" not in html:
+                continue
+            filler = FILLER * (size // len(FILLER))
+            pages[f"{name[:-5]}@{size // 1024}k"] = html.replace("<!--pad-->", filler).encode("utf-8")
+    return pages
+
+
+def serve(pages):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = pages.get(self.path.lstrip("/"))
+            if body is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the streaming reader hangs up once it has what it needs
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def median_ms(fn, url, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn(url)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    pages = load_pages()
+    server = serve(pages)
+    base = f"http://127.0.0.1:{server.server_port}/"
+
+    print(f"{'page':40} {'bytes':>9} {'old ms':>8} {'new ms':>8} {'speedup':>8}  same result")
+    for name, body in pages.items():
+        url = base + name
+        old_ms, old = median_ms(old_extract_website_data, url, runs)
+        new_ms, new = median_ms(app.extract_website_data, url, runs)
+
+        same = "yes" if old == new else f"no: {old!r} vs {new!r}"
+        if old[1] == new[1] and old[0] and not new[0] and len(body) > app.SCRAPE_BODY_BYTES:
+            # by design: reading stops SCRAPE_BODY_BYTES after </head>
+            same = "description only: email is past the scan limit"
+        print(f"{name:40} {len(body):>9} {old_ms:>8.2f} {new_ms:>8.2f} {old_ms / new_ms:>7.1f}x  {same}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import html
+import os
+import re
+
+import jobs
+import llm_gateway
+from db import get_db_connection
+
+# ===============================
+# CONVERSATION MEMORY
+# ===============================
+# Each message is stored with a plain-text copy and a token estimate at write
+# time, so building a prompt needs no HTML stripping. The prompt history is
+# the chat's rolling summary plus the newest turns that fit HISTORY_BUDGET.
+# Once the unsummarized turns pass that budget, a background job folds the
+# oldest of them into the summary (chat_summaries), keeping RECENT_BUDGET
+# tokens of verbatim history.
+
+HISTORY_BUDGET = int(os.getenv("CHAT_HISTORY_TOKENS", "1500"))
+RECENT_BUDGET = int(os.getenv("CHAT_RECENT_TOKENS", "600"))
+SUMMARY_MAX_TOKENS = 300
+
+
+def estimate_tokens(text):
+    """Cheap local estimate: about four characters per token for English."""
+    return (len(text or "") + 3) // 4
+
+
+def html_to_text(content):
+    """Convert stored chat HTML into plain text before sending to the model."""
+    if not content:
+        return ""
+    text = re.sub(r"<br\s*/?>", "\n", content, flags=re.I)
+    text = re.sub(r"</?(ul|ol)\b[^>]*>", "\n", text, flags=re.I)
+    text = re.sub(r"<li\b[^>]*>", "- ", text, flags=re.I)
+    text = re.sub(r"</li>", "\n", text, flags=re.I)
+    text = re.sub(r"<[^>]+>", "", text)
+    text = html.unescape(text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def _tail(conn, chat_id):
+    """Summary row and the unsummarized messages [(id, role, plain, tokens)]."""
+    summary = conn.execute(
+        "SELECT summary, upto_message_id FROM chat_summaries WHERE chat_id = ?",
+        (chat_id,)
+    ).fetchone()
+    summary_text, upto = summary if summary else ("", 0)
+
+    rows = conn.execute("""
+        SELECT id, role, plain, tokens, content
+        FROM messages
+        WHERE chat_id = ? AND id > ?
+        ORDER BY id ASC
+    """, (chat_id, upto)).fetchall()
+
+    # rows written before plain copies existed are converted once, here
+    missing = [(r[0], html_to_text(r[4])) for r in rows if r[2] is None]
+    if missing:
+        conn.executemany(
+            "UPDATE messages SET plain = ?, tokens = ? WHERE id = ?",
+            [(plain, estimate_tokens(plain), message_id) for message_id, plain in missing]
+        )
+        conn.commit()
+        converted = dict(missing)
+        rows = [
+            (r[0], r[1], converted[r[0]], estimate_tokens(converted[r[0]])) if r[2] is None else r[:4]
+            for r in rows
+        ]
+    else:
+        rows = [r[:4] for r in rows]
+
+    return summary_text, rows
+
+
+def history(chat_id):
+    """Prompt messages: the rolling summary, then the newest turns in budget."""
+    conn = get_db_connection()
+    summary, rows = _tail(conn, chat_id)
+    conn.close()
+
+    budget = HISTORY_BUDGET - estimate_tokens(summary)
+    window = []
+    for _, role, plain, tokens in reversed(rows):
+        if role not in ("user", "assistant", "system") or not plain:
+            continue
+        if window and tokens > budget:
+            break
+        window.append({"role": role, "content": plain})
+        budget -= tokens
+    window.reverse()
+
+    if summary:
+        window.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    return window
+
+
+def maybe_compact(chat_id, user):
+    """Queue a summary refresh once the unsummarized turns exceed the budget."""
+    conn = get_db_connection()
+    row = conn.execute("""
+        SELECT COALESCE(SUM(m.tokens), 0)
+        FROM messages m
+        LEFT JOIN chat_summaries s ON s.chat_id = m.chat_id
+        WHERE m.chat_id = ? AND m.id > COALESCE(s.upto_message_id, 0)
+    """, (chat_id,)).fetchone()
+    conn.close()
+
+    # one pending summary per chat; a user's other chats are summarized independently
+    if row[0] > HISTORY_BUDGET and not jobs.find_active("chat_summary", user, chat_id=chat_id):
+        jobs.enqueue("chat_summary", {"chat_id": chat_id}, user=user, chat_id=chat_id)
+
+
+@jobs.register("chat_summary")
+def compact(job_id, payload):
+    """Fold the oldest unsummarized turns into the chat's rolling summary."""
+    chat_id = payload["chat_id"]
+
+    conn = get_db_connection()
+    summary, rows = _tail(conn, chat_id)
+    conn.close()
+
+    # keep the newest RECENT_BUDGET tokens verbatim, fold everything before
+    kept = 0
+    split = len(rows)
+    while split > 0 and kept + (rows[split - 1][3] or 0) <= RECENT_BUDGET:
+        split -= 1
+        kept += rows[split][3] or 0
+    fold = rows[:split]
+    if not fold:
+        return {"folded": 0}
+
+    transcript = "\n".join(f"{role.upper()}: {plain}" for _, role, plain, _ in fold if plain)
+    prompt = f"""
+    Update the running summary of a sales-strategy conversation.
+
+    Current summary:
+    {summary or "(none)"}
+
+    New turns:
+    {transcript}
+
+    Write the updated summary in under 150 words. Keep the product, target
+    industries, cities, decisions made and open questions. Plain text only.
+    """
+
+    new_summary = llm_gateway.complete(
+        [{"role": "user", "content": prompt}],
+        temperature=0,
+        max_tokens=SUMMARY_MAX_TOKENS,
+        label="chat_summary"
+    ).strip()
+
+    conn = get_db_connection()
+    conn.execute("""
+        INSERT INTO chat_summaries (chat_id, summary, upto_message_id, updated_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(chat_id) DO UPDATE SET
+            summary = excluded.summary,
+            upto_message_id = excluded.upto_message_id,
+            updated_at = excluded.updated_at
+    """, (chat_id, new_summary, fold[-1][0]))
+    conn.commit()
+    conn.close()
+
+    return {"folded": len(fold)}
@@ -0,0 +1,204 @@
+import re
+from urllib.parse import urlparse
+
+# ===============================
+# GLOBAL COMPANY STORE
+# ===============================
+# Each real business is stored once in `company_entities`, keyed on its
+# normalized website domain (or phone, or name+address as a last resort).
+# Projects point at entities through slim `project_leads` rows that carry
+# the per-project status/reason/timestamps. The `companies` view joins the
+# two back into the old flat shape for read queries.
+
+ENTITY_FIELDS = [
+    "name", "website", "phone", "address", "rating", "description",
+    "email", "ceo", "company_linkedin", "leadership_linkedin",
+]
+
+# Hosts shared by many businesses; a link to them says nothing about identity
+SHARED_HOSTS = {
+    "facebook.com", "instagram.com", "linkedin.com", "twitter.com", "x.com",
+    "linktr.ee", "google.com", "sites.google.com", "business.site",
+    "wa.me", "youtube.com", "justdial.com", "indiamart.com",
+}
+
+
+def normalize_domain(website):
+    if not website:
+        return ""
+    url = website.strip().lower()
+    if "://" not in url:
+        url = "http://" + url
+    host = (urlparse(url).hostname or "").strip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    if not host or host in SHARED_HOSTS or any(host.endswith("." + h) for h in SHARED_HOSTS):
+        return ""
+    return host
+
+
+def normalize_phone(phone):
+    digits = re.sub(r"\D", "", phone or "")
+    return digits[-10:] if len(digits) >= 7 else ""
+
+
+# normalize_phone() in SQL for the usual separators; backs idx_company_entities_phone
+PHONE_SQL = (
+    "substr(replace(replace(replace(replace(replace(replace("
+    "phone, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', ''), -10)"
+)
+
+
+def key_of(c):
+    """The entity a company dict belongs to: an explicit "entity_key" wins."""
+    return c.get("entity_key") or entity_key(c)
+
+
+def entity_key(c):
+    domain = normalize_domain(c.get("website"))
+    if domain:
+        return "d:" + domain
+
+    phone = normalize_phone(c.get("phone"))
+    if phone:
+        return "p:" + phone
+
+    name = re.sub(r"\s+", " ", (c.get("name") or "")).strip().lower()
+    address = re.sub(r"\s+", " ", (c.get("address") or "")).strip().lower()
+    return f"n:{name}|{address}"
+
+
+# New values win unless they are empty; "Not Available" never beats a real CEO
+_UPSERT_SQL = """
+INSERT INTO company_entities
+    (entity_key, name, website, phone, address, rating, description,
+     email, ceo, company_linkedin, leadership_linkedin, enriched_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(entity_key) DO UPDATE SET
+    name = COALESCE(NULLIF(excluded.name, ''), name),
+    website = COALESCE(NULLIF(excluded.website, ''), website),
+    phone = COALESCE(NULLIF(excluded.phone, ''), phone),
+    address = COALESCE(NULLIF(excluded.address, ''), address),
+    rating = COALESCE(NULLIF(excluded.rating, ''), rating),
+    description = COALESCE(NULLIF(excluded.description, ''), description),
+    email = COALESCE(NULLIF(excluded.email, ''), email),
+    ceo = CASE WHEN excluded.ceo IS NULL OR excluded.ceo IN ('', 'Not Available')
+               THEN COALESCE(ceo, excluded.ceo) ELSE excluded.ceo END,
+    company_linkedin = COALESCE(NULLIF(excluded.company_linkedin, ''), company_linkedin),
+    leadership_linkedin = COALESCE(NULLIF(excluded.leadership_linkedin, ''), leadership_linkedin),
+    enriched_at = COALESCE(excluded.enriched_at, enriched_at),
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+
+def upsert_entities(cur, companies):
+    """Insert or merge company dicts; returns {entity_key: entity_id}.
+
+    A dict's "enriched_at" marks it as carrying fresh enrichment results.
+    """
+    rows = []
+    for c in companies:
+        rows.append((key_of(c), *[
+            str(c.get(f)) if c.get(f) is not None else None for f in ENTITY_FIELDS
+        ], c.get("enriched_at")))
+
+    if not rows:
+        return {}
+
+    cur.executemany(_UPSERT_SQL, rows)
+
+    keys = list({r[0] for r in rows})
+    ids = {}
+    # stay well under SQLite's bound-parameter limit
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        for entity_id, key in cur.execute(
+            f"SELECT id, entity_key FROM company_entities WHERE entity_key IN ({placeholders})",
+            chunk
+        ):
+            ids[key] = entity_id
+    return ids
+
+
+def link_leads(cur, chat_id, entity_ids):
+    """Attach entities to a project; returns how many links were new."""
+    # rowcount, not total_changes: the sort-key trigger's updates must not count
+    cur.executemany(
+        "INSERT OR IGNORE INTO project_leads (entity_id, chat_id) VALUES (?, ?)",
+        [(entity_id, chat_id) for entity_id in entity_ids]
+    )
+    return max(cur.rowcount, 0)
+
+
+def linked_entities(cur, chat_id, entity_ids):
+    """The subset of entity_ids already linked to a project."""
+    linked = set()
+    entity_ids = list(set(entity_ids))
+    for i in range(0, len(entity_ids), 500):
+        chunk = entity_ids[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        linked.update(row[0] for row in cur.execute(f"""
+            SELECT entity_id FROM project_leads
+            WHERE chat_id = ? AND entity_id IN ({placeholders})
+        """, [chat_id] + chunk))
+    return linked
+
+
+def find_entities(cur, keys):
+    """Return {entity_key: dict} for already-stored entities."""
+    found = {}
+    keys = list(set(keys))
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = cur.execute(f"""
+            SELECT entity_key, id, {", ".join(ENTITY_FIELDS)}, enriched_at
+            FROM company_entities
+            WHERE entity_key IN ({placeholders})
+        """, chunk).fetchall()
+        for row in rows:
+            entity = dict(zip(ENTITY_FIELDS, row[2:-1]))
+            entity["id"] = row[1]
+            entity["enriched_at"] = row[-1]
+            found[row[0]] = entity
+    return found
+
+
+def match_entities(cur, companies):
+    """Return {index: entity} for company dicts that are already stored.
+
+    Matched on the entity key (normalized website, else phone, else name +
+    address) and then on normalized phone alone, so a business found once
+    with a website and once without still resolves to one entity. Matched
+    entities carry their "entity_key".
+    """
+    keys = [key_of(c) for c in companies]
+    found = find_entities(cur, keys)
+    matches = {i: found[key] for i, key in enumerate(keys) if key in found}
+    for key, entity in found.items():
+        entity["entity_key"] = key
+
+    phones = {}
+    for i, c in enumerate(companies):
+        phone = normalize_phone(c.get("phone"))
+        if i not in matches and phone:
+            phones.setdefault(phone, []).append(i)
+
+    phone_list = list(phones)
+    for start in range(0, len(phone_list), 500):
+        chunk = phone_list[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = cur.execute(f"""
+            SELECT entity_key, {PHONE_SQL}
+            FROM company_entities
+            WHERE {PHONE_SQL} IN ({placeholders})
+        """, chunk).fetchall()
+        by_phone = {phone: key for key, phone in rows}
+        stored = find_entities(cur, list(by_phone.values()))
+        for phone, key in by_phone.items():
+            stored[key]["entity_key"] = key
+            for i in phones[phone]:
+                matches[i] = stored[key]
+
+    return matches
@@ -1,9 +1,11 @@
+import itertools
 import json
-from groq import Groq
+import threading
+from collections import OrderedDict
 import os
-
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-client = Groq(api_key=GROQ_API_KEY)
+import numpy as np
+import relevance
+import llm_gateway
 
 def find_matching_projects(company_name, company_description, projects):
     """
@@ -33,13 +35,11 @@ def find_matching_projects(company_name, company_description, projects):
         If none match return [].
         """
 
-        completion = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3
-        )
-
-        text = completion.choices[0].message.content.strip()
+        text = llm_gateway.complete(
+            [{"role": "user", "content": prompt}],
+            temperature=0.3,
+            label="cross_project_match"
+        ).strip()
 
         start = text.find("[")
         end = text.rfind("]") + 1
@@ -51,4 +51,146 @@ def find_matching_projects(company_name, company_description, projects):
 
     except Exception as e:
         print("Cross match error:", e)
-        return []
\ No newline at end of file
+        return []
+
+# ===============================
+# VECTOR MATCHER
+# ===============================
+# Each user's projects are kept as rows of an embedding matrix (same space as
+# relevance.py), updated when a project is created, edited or deleted. A
+# company is scored against all of them with one matrix-vector product; the
+# LLM above is only asked about projects whose scores are ambiguous. Results
+# are cached per (user, company, project-set version); versions come from one
+# process-wide counter so a user's state can be dropped and rebuilt without
+# a new project set reusing an old version number.
+
+MATCH_SCORE = float(os.getenv("MATCH_SCORE", "0.35"))          # sure match
+AMBIGUOUS_SCORE = float(os.getenv("MATCH_AMBIGUOUS_SCORE", "0.15"))  # ask the LLM
+RESULT_CACHE_SIZE = 5000
+
+_lock = threading.Lock()
+_user_projects = {}
+_results = OrderedDict()
+_versions = itertools.count(1)
+
+
+def _project_text(title, description):
+    return f"{title or ''} {description or ''}"
+
+
+def _rebuild_user(user, projects):
+    """projects = [(chat_id, title, description)]"""
+    vectors, model_version = relevance.embed([_project_text(t, d) for _, t, d in projects])
+    state = {
+        "ids": [p[0] for p in projects],
+        "titles": [p[1] for p in projects],
+        "descriptions": [p[2] or "" for p in projects],
+        "matrix": vectors,
+        "model_version": model_version,
+        "version": next(_versions),
+    }
+    _user_projects[user] = state
+    return state
+
+
+def update_project(user, chat_id, title, description):
+    """Add or refresh one project row after it was created or edited."""
+    with _lock:
+        state = _user_projects.get(user)
+        if state is None:
+            return  # built lazily on the next match
+
+        vectors, model_version = relevance.embed([_project_text(title, description)])
+        if vectors is None or model_version != state["model_version"]:
+            del _user_projects[user]
+            return
+
+        if chat_id in state["ids"]:
+            pos = state["ids"].index(chat_id)
+            state["titles"][pos] = title
+            state["descriptions"][pos] = description or ""
+            state["matrix"][pos] = vectors[0]
+        else:
+            state["ids"].append(chat_id)
+            state["titles"].append(title)
+            state["descriptions"].append(description or "")
+            state["matrix"] = np.vstack([state["matrix"], vectors])
+        state["version"] = next(_versions)
+
+
+def remove_project(user, chat_id):
+    with _lock:
+        state = _user_projects.get(user)
+        if state is None or chat_id not in state["ids"]:
+            return
+        pos = state["ids"].index(chat_id)
+        for key in ("ids", "titles", "descriptions"):
+            del state[key][pos]
+        state["matrix"] = np.delete(state["matrix"], pos, axis=0)
+        state["version"] = next(_versions)
+
+
+def match_company(user, company_id, company_name, company_description, projects):
+    """
+    projects = list of tuples [(chat_id, project_name, project_description)]
+    Returns list of matching project names, best first
+    """
+    if not projects:
+        return []
+
+    # The relevance index can be refit between reading the matrix and
+    # embedding the company; the vector must come from the matrix's model, so
+    # on a version mismatch rebuild the matrix and try once more.
+    for _ in range(2):
+        with _lock:
+            state = _user_projects.get(user)
+            if (
+                state is None
+                or state["matrix"] is None
+                or state["model_version"] != relevance.model_version()
+                or set(state["ids"]) != {p[0] for p in projects}
+            ):
+                state = _rebuild_user(user, projects)
+
+            key = (user, company_id, state["version"])
+            if key in _results:
+                _results.move_to_end(key)
+                return list(_results[key])
+
+            titles = list(state["titles"])
+            descriptions = list(state["descriptions"])
+            matrix = state["matrix"]
+            model_version = state["model_version"]
+
+        if matrix is None:
+            break
+        vectors, vector_version = relevance.embed([_project_text(company_name, company_description)])
+        if vectors is not None and vector_version == model_version:
+            break
+        vectors = None
+
+    if matrix is None or vectors is None:
+        # nothing indexed yet to embed against (or it keeps changing under
+        # us); ask the LLM directly
+        matches = find_matching_projects(company_name, company_description, list(zip(titles, descriptions)))
+    else:
+        scores = matrix @ vectors[0]
+        order = np.argsort(-scores, kind="stable")
+
+        matches = [titles[i] for i in order if scores[i] >= MATCH_SCORE]
+        ambiguous = [i for i in order if AMBIGUOUS_SCORE <= scores[i] < MATCH_SCORE]
+
+        if ambiguous:
+            confirmed = find_matching_projects(
+                company_name,
+                company_description,
+                [(titles[i], descriptions[i]) for i in ambiguous]
+            )
+            matches += [titles[i] for i in ambiguous if titles[i] in confirmed]
+
+    with _lock:
+        _results[key] = list(matches)
+        while len(_results) > RESULT_CACHE_SIZE:
+            _results.popitem(last=False)
+
+    return matches
@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(BASE_DIR, "leads.db")
+
+# ===============================
+# CONNECTION MANAGER
+# ===============================
+# One connection per request (stored on flask.g, closed on teardown) or, for
+# background threads, one long-lived connection per thread. Helpers keep
+# calling conn.close(); on a managed connection that only discards
+# uncommitted work, exactly like a real close would, and the handle is reused.
+
+BUSY_TIMEOUT = 5.0          # seconds to wait on a locked database
+CACHE_SIZE_KB = 16 * 1024   # page cache per connection
+MMAP_SIZE = 128 * 1024 * 1024
+STATEMENT_CACHE = 256       # prepared statements kept per connection
+
+_local = threading.local()
+
+
+class ManagedConnection(sqlite3.Connection):
+
+    managed = False
+    unit_depth = 0      # > 0 while a unit_of_work() is open
+    commits = 0
+
+    def commit(self):
+        # inside a unit of work the outermost block commits once
+        if self.unit_depth:
+            return
+        if self.in_transaction:
+            self.commits += 1
+        super().commit()
+
+    def close(self):
+        if not self.managed:
+            return super().close()
+        if self.in_transaction and not self.unit_depth:
+            self.rollback()
+
+    def release(self):
+        """Really close the underlying handle."""
+        if self.in_transaction:
+            self.rollback()
+        super().close()
+
+
+def _connect():
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT,
+        factory=ManagedConnection,
+        cached_statements=STATEMENT_CACHE,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.managed = True
+    return conn
+
+
+def get_db_connection():
+    if has_app_context():
+        conn = g.get("_db_conn")
+        if conn is None:
+            conn = g._db_conn = _connect()
+            if g.get("_count_queries"):
+                conn.set_trace_callback(_count_query)
+        return conn
+
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = _connect()
+    return conn
+
+
+def close_db(exc=None):
+    conn = g.pop("_db_conn", None)
+    if conn is not None:
+        conn.release()
+
+
+def close_thread_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        conn.release()
+
+
+# ===============================
+# REQUEST SCOPE
+# ===============================
+# Within a request, rows that many helpers look up (the logged-in user, a
+# project, its product) are loaded once and kept in an identity map on
+# flask.g; writers call forget() for what they change. unit_of_work() makes
+# the helpers' own commit() calls no-ops until the block ends, so a request
+# that saves several rows commits once. With QUERY_COUNT_HEADER on (or in
+# debug mode) responses carry X-Query-Count and X-Commit-Count.
+
+_COUNTED = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+
+def memo(kind, key, load):
+    """Return the cached (kind, key) value for this request, loading it once."""
+    if not has_app_context():
+        return load()
+    identity = g.setdefault("_identity", {})
+    if (kind, key) not in identity:
+        identity[(kind, key)] = load()
+    return identity[(kind, key)]
+
+
+def forget(kind, key):
+    if has_app_context():
+        g.get("_identity", {}).pop((kind, key), None)
+
+
+@contextmanager
+def unit_of_work():
+    """Group the writes made inside the block into one transaction."""
+    conn = get_db_connection()
+    conn.unit_depth += 1
+    try:
+        yield conn
+    except BaseException:
+        conn.unit_depth -= 1
+        if not conn.unit_depth:
+            conn.rollback()
+            if has_app_context():
+                g.pop("_identity", None)
+        raise
+    conn.unit_depth -= 1
+    if not conn.unit_depth:
+        conn.commit()
+
+
+def _count_query(sql):
+    if sql.lstrip().upper().startswith(_COUNTED):
+        g._query_count = g.get("_query_count", 0) + 1
+
+
+def _start_count():
+    if current_app.debug or current_app.config.get("QUERY_COUNT_HEADER"):
+        g._count_queries = True
+
+
+def _query_count_header(response):
+    if not g.get("_count_queries"):
+        return response
+    conn = g.get("_db_conn")
+    response.headers["X-Query-Count"] = str(g.get("_query_count", 0))
+    response.headers["X-Commit-Count"] = str(conn.commits if conn is not None else 0)
+    return response
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
+    app.config.setdefault("QUERY_COUNT_HEADER", os.getenv("QUERY_COUNT_HEADER") == "1")
+    app.before_request(_start_count)
+    app.after_request(_query_count_header)
@@ -0,0 +1,250 @@
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from db import get_db_connection
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+# ===============================
+# STREAMING LEAD EXPORT
+# ===============================
+# Leads are read from a lazy SQLite cursor in chunks and encoded straight
+# into the HTTP response: no workbook in memory and no file on disk. XLSX is
+# written by hand (inline strings, one worksheet) into a zip archive that is
+# emitted piece by piece; CSV is plain text; Parquet is written one row group
+# per chunk when pyarrow is installed.
+
+FETCH_SIZE = 1000           # rows pulled from the cursor at a time
+PARQUET_ROW_GROUP = 10000
+
+HEADERS = [
+    "Company", "Website", "Phone", "Address", "Rating",
+    "Description", "Email", "CEO", "Company LinkedIn", "Leadership LinkedIn",
+]
+
+_FIELDS = [
+    "name", "website", "phone", "address", "rating",
+    "description", "email", "ceo", "company_linkedin", "leadership_linkedin",
+]
+
+FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def available_formats():
+    return [f for f in FORMATS if f != "parquet" or pq is not None]
+
+
+def iter_chunks(chat_id):
+    """Yield lists of lead rows for a project, FETCH_SIZE at a time."""
+    conn = get_db_connection()
+    cur = conn.execute(f"""
+        SELECT {", ".join(_FIELDS)}
+        FROM companies
+        WHERE chat_id = ?
+        ORDER BY id
+    """, (chat_id,))
+    try:
+        while True:
+            rows = cur.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+        conn.close()
+
+
+# ---------------------
+# CSV
+# ---------------------
+
+def stream_csv(chat_id):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    # BOM so Excel picks UTF-8 when the CSV is double-clicked
+    buf.write("\ufeff")
+    writer.writerow(HEADERS)
+
+    for rows in iter_chunks(chat_id):
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+# ---------------------
+# XLSX
+# ---------------------
+
+class _Pipe:
+    """Write-only sink for ZipFile/pyarrow; drain() hands back what was written so far."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def writable(self):
+        return True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+_ILLEGAL_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_NUMBER = re.compile(r"^-?\d+(\.\d+)?$")
+
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>"""
+
+_ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+# style 0 = default, style 1 = bold (header row)
+_STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/><xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>"""
+
+
+def _cell(value, style="", numeric=False):
+    if value is None or value == "":
+        return "<c/>"
+    text = str(value)
+    if numeric and _NUMBER.match(text) and len(text) < 15:
+        return f"<c{style}><v>{text}</v></c>"
+    text = escape(_ILLEGAL_XML.sub("", text))
+    return f'<c{style} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+_RATING = _FIELDS.index("rating")
+
+
+def _row(values, style=""):
+    # only the rating is written as a number; phones keep their leading zeros
+    return "<row>" + "".join(_cell(v, style, i == _RATING) for i, v in enumerate(values)) + "</row>"
+
+
+def sheet_name(title):
+    name = re.sub(r"[\[\]:*?/\\]", "", title or "").strip()[:31]
+    return name or "Leads"
+
+
+def stream_xlsx(chat_id, title):
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _ROOT_RELS)
+        zf.writestr("xl/workbook.xml", _WORKBOOK.format(name=escape(sheet_name(title), {'"': "&quot;"})))
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        zf.writestr("xl/styles.xml", _STYLES)
+        yield pipe.drain()
+
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_row(HEADERS, ' s="1"').encode("utf-8"))
+
+            for rows in iter_chunks(chat_id):
+                sheet.write("".join(_row(r) for r in rows).encode("utf-8"))
+                yield pipe.drain()
+
+            sheet.write(b"</sheetData></worksheet>")
+
+    yield pipe.drain()
+
+
+# ---------------------
+# Parquet (optional)
+# ---------------------
+
+def stream_parquet(chat_id):
+    schema = pa.schema([(f, pa.string()) for f in _FIELDS])
+    pipe = _Pipe()
+    writer = pq.ParquetWriter(pa.PythonFile(pipe, mode="w"), schema)
+
+    batch = []
+    for rows in iter_chunks(chat_id):
+        batch.extend(rows)
+        if len(batch) >= PARQUET_ROW_GROUP:
+            writer.write_table(_table(batch, schema))
+            batch = []
+            yield pipe.drain()
+
+    if batch:
+        writer.write_table(_table(batch, schema))
+    writer.close()
+    yield pipe.drain()
+
+
+def _table(rows, schema):
+    columns = list(zip(*rows))
+    return pa.table(
+        [[None if v is None else str(v) for v in col] for col in columns],
+        schema=schema
+    )
+
+
+def stream(fmt, chat_id, title):
+    """Return a generator of bytes for the export in the requested format."""
+    if fmt == "csv":
+        return stream_csv(chat_id)
+    if fmt == "parquet":
+        return stream_parquet(chat_id)
+    return stream_xlsx(chat_id, title)
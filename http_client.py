@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# ===============================
+# SHARED HTTP CLIENT
+# ===============================
+# Every outbound scraping / SerpAPI call goes through one pooled keep-alive
+# session. Each host gets a concurrency cap, rate-limited hosts (SerpAPI)
+# share a token bucket, and 429/5xx responses are retried with backoff.
+
+POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "32"))
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", "4"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5"))
+# Longest Retry-After we sleep for; a scraped site asking for hours must not
+# hold an enrichment thread (and the targeting job waiting on it) that long
+MAX_RETRY_AFTER = float(os.getenv("HTTP_MAX_RETRY_AFTER", "10"))
+
+DEFAULT_TIMEOUT = (5, 20)  # (connect, read) seconds
+USER_AGENT = "Mozilla/5.0 (compatible; Gen6LeadBot/1.0)"
+
+
+class CappedRetry(Retry):
+    """Retry that honours Retry-After, but never waits longer than MAX_RETRY_AFTER."""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_RETRY_AFTER)
+
+
+def _build_session():
+    retry = CappedRetry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=1,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=retry,
+    )
+
+    s = requests.Session()
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    s.headers["User-Agent"] = USER_AGENT
+    return s
+
+
+session = _build_session()
+
+# ===============================
+# PER-HOST LIMITS
+# ===============================
+_host_limits = {}
+_rate_limits = {}
+_limits_lock = threading.Lock()
+
+
+class RateLimiter:
+    """Token bucket allowing `per_minute` calls with bursts up to `burst`."""
+
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst or max(1, per_minute // 10))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+def _host(url):
+    return (urlparse(url).hostname or "").lower()
+
+
+def host_limit(url):
+    """Return the semaphore capping concurrent requests to the host of url."""
+    host = _host(url)
+    with _limits_lock:
+        sem = _host_limits.get(host)
+        if sem is None:
+            sem = _host_limits[host] = threading.BoundedSemaphore(PER_HOST_LIMIT)
+    return sem
+
+
+def set_rate_limit(url_or_host, per_minute, burst=None):
+    """Throttle all requests to a host, e.g. to stay inside an API quota."""
+    host = _host(url_or_host) if "://" in url_or_host else url_or_host.lower()
+    with _limits_lock:
+        if per_minute:
+            _rate_limits[host] = RateLimiter(per_minute, burst)
+        else:
+            _rate_limits.pop(host, None)
+
+
+def get(url, params=None, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """GET through the shared session, honouring host caps and rate limits."""
+    limiter = _rate_limits.get(_host(url))
+    if limiter:
+        limiter.acquire()
+
+    with host_limit(url):
+        return session.get(url, params=params, timeout=timeout, **kwargs)
+
+
+@contextmanager
+def stream(url, params=None, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """Open a streamed GET; the host slot is held until the body is closed."""
+    limiter = _rate_limits.get(_host(url))
+    if limiter:
+        limiter.acquire()
+
+    with host_limit(url):
+        resp = session.get(url, params=params, timeout=timeout, stream=True, **kwargs)
+        try:
+            yield resp
+        finally:
+            resp.close()
@@ -0,0 +1,227 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_gateway
+from db import get_db_connection
+
+# ===============================
+# INCREMENTAL PORTFOLIO ANALYSIS
+# ===============================
+# Company -> best matching project(s) results for /industry_viewed are stored
+# per user and company in `company_project_matches`. Each row remembers a
+# hash of its inputs (company text + the user's whole project set), so a
+# refresh only re-analyzes companies whose inputs changed. Work is split into
+# fixed-size batches sent to the LLM concurrently at temperature 0.
+# Page views never hash the portfolio: they compare a cheap marker (the
+# user's project rows plus lead count, newest lead id and summed entity
+# revisions) with the one stored by the last complete refresh.
+
+BATCH_SIZE = 10
+MAX_PARALLEL = 4
+
+
+def _load_projects(conn, user):
+    return conn.execute("""
+        SELECT ch.id, COALESCE(NULLIF(p.product_name, ''), ch.title), p.description
+        FROM chats ch
+        JOIN products p ON p.chat_id = ch.id
+        WHERE ch.user = ?
+        ORDER BY ch.id
+    """, (user,)).fetchall()
+
+
+def _load_portfolio(conn, user):
+    projects = _load_projects(conn, user)
+
+    companies = conn.execute("""
+        SELECT DISTINCT e.id, e.name, e.description, e.rating
+        FROM chats ch
+        JOIN project_leads l ON l.chat_id = ch.id
+        JOIN company_entities e ON e.id = l.entity_id
+        WHERE ch.user = ?
+        ORDER BY e.id
+    """, (user,)).fetchall()
+
+    return projects, companies
+
+
+def _input_hash(company, projects):
+    raw = json.dumps([company[1:], [p[1:] for p in projects]], default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _stale(conn, user):
+    """Return (projects, companies needing analysis, ids no longer in the portfolio)."""
+    projects, companies = _load_portfolio(conn, user)
+    stored = dict(conn.execute(
+        "SELECT entity_id, input_hash FROM company_project_matches WHERE user = ?",
+        (user,)
+    ).fetchall())
+
+    current = {c[0] for c in companies}
+    stale = [c for c in companies if stored.get(c[0]) != _input_hash(c, projects)]
+    removed = [entity_id for entity_id in stored if entity_id not in current]
+    return projects, stale, removed
+
+
+def _marker(conn, user):
+    """Fingerprint that changes whenever a refresh could find something stale."""
+    leads = conn.execute("""
+        SELECT COUNT(*), MAX(l.id), TOTAL(e.revision)
+        FROM chats ch
+        JOIN project_leads l ON l.chat_id = ch.id
+        JOIN company_entities e ON e.id = l.entity_id
+        WHERE ch.user = ?
+    """, (user,)).fetchone()
+    raw = json.dumps([_load_projects(conn, user), list(leads)], default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def needs_refresh(user):
+    """True if the portfolio changed since the last complete refresh."""
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            "SELECT marker FROM portfolio_analysis_state WHERE user = ?", (user,)
+        ).fetchone()
+        return row is None or row[0] != _marker(conn, user)
+    finally:
+        conn.close()
+
+
+def _save_marker(user, marker):
+    conn = get_db_connection()
+    conn.execute("""
+        INSERT INTO portfolio_analysis_state (user, marker) VALUES (?, ?)
+        ON CONFLICT(user) DO UPDATE SET marker = excluded.marker, updated_at = CURRENT_TIMESTAMP
+    """, (user, marker))
+    conn.commit()
+    conn.close()
+
+
+def get_analysis(user):
+    """Stored results for the page: [{"company": ..., "projects": [...]}]."""
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT company_name, projects
+        FROM company_project_matches
+        WHERE user = ? AND projects != '[]'
+        ORDER BY company_name
+    """, (user,)).fetchall()
+    conn.close()
+
+    return [{"company": name, "projects": json.loads(projects)} for name, projects in rows]
+
+
+def _analyze_batch(projects, batch):
+    """Ask the LLM which projects fit each company; returns {entity_id: [names]}."""
+    context_text = "PROJECTS:\n"
+    for _, name, desc in projects:
+        context_text += f"- {name}: {desc or ''}\n"
+
+    context_text += "\nCOMPANIES:\n"
+    for entity_id, name, desc, rating in batch:
+        context_text += f"[{entity_id}] {name} (Rating: {rating}) - {desc or ''}\n"
+
+    prompt = f"""
+    Analyze the following sales projects and companies:
+
+    {context_text}
+
+    For each company:
+    - Identify the BEST matching project(s), using the exact project names
+    - Return ONLY valid JSON in this format:
+
+    [
+    {{
+        "id": 123,
+        "projects": ["Project 1", "Project 2"]
+    }}
+    ]
+
+    Return ONLY JSON. No explanation. No HTML.
+    """
+
+    response_text = llm_gateway.complete(
+        [{"role": "user", "content": prompt}],
+        temperature=0,
+        label="industry_analysis"
+    ).strip()
+
+    start = response_text.find("[")
+    end = response_text.rfind("]") + 1
+    if start == -1:
+        return {}
+
+    valid = {p[1] for p in projects}
+    results = {}
+    for item in json.loads(response_text[start:end]):
+        try:
+            entity_id = int(item.get("id"))
+        except (TypeError, ValueError, AttributeError):
+            continue
+        results[entity_id] = [p for p in item.get("projects", []) if p in valid]
+    return results
+
+
+def refresh(user):
+    """Re-analyze only changed companies; returns counts for the job result.
+
+    The marker is stored only once every stale company was analyzed, so
+    failed batches are retried on the next page view.
+    """
+    conn = get_db_connection()
+    # taken first: anything that changes while we work moves it again
+    marker = _marker(conn, user)
+    projects, stale, removed = _stale(conn, user)
+
+    if removed:
+        conn.executemany(
+            "DELETE FROM company_project_matches WHERE user = ? AND entity_id = ?",
+            [(user, entity_id) for entity_id in removed]
+        )
+        conn.commit()
+    conn.close()
+
+    if not stale or not projects:
+        # nothing the LLM could match; settled until the portfolio changes
+        _save_marker(user, marker)
+        return {"analyzed": 0, "removed": len(removed)}
+
+    batches = [stale[i:i + BATCH_SIZE] for i in range(0, len(stale), BATCH_SIZE)]
+
+    def run(batch):
+        try:
+            return batch, _analyze_batch(projects, batch)
+        except Exception as e:
+            print(f"Industry analysis error: {e}")
+            return batch, None
+
+    analyzed = 0
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL) as pool:
+        for batch, results in pool.map(run, batches):
+            if results is None:
+                continue  # leave stale; retried on the next refresh
+
+            conn = get_db_connection()
+            conn.executemany("""
+                INSERT INTO company_project_matches
+                    (user, entity_id, company_name, projects, input_hash, updated_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(user, entity_id) DO UPDATE SET
+                    company_name = excluded.company_name,
+                    projects = excluded.projects,
+                    input_hash = excluded.input_hash,
+                    updated_at = excluded.updated_at
+            """, [
+                (user, c[0], c[1], json.dumps(results.get(c[0], [])), _input_hash(c, projects))
+                for c in batch
+            ])
+            conn.commit()
+            conn.close()
+            analyzed += len(batch)
+
+    if analyzed == len(stale):
+        _save_marker(user, marker)
+    return {"analyzed": analyzed, "removed": len(removed)}
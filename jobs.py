@@ -0,0 +1,225 @@
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+
+from db import get_db_connection
+
+# ===============================
+# BACKGROUND JOB QUEUE
+# ===============================
+# Long-running work (lead targeting, bulk jobs) is stored in the `jobs` table
+# and picked up by worker threads, so HTTP requests only enqueue and return.
+# Claiming is a conditional UPDATE, so several processes can share the queue.
+# A claimed job carries its owner (host:pid) and a lease that a heartbeat
+# thread keeps extending; only jobs whose lease ran out (their process died)
+# go back in the queue, so a restart never re-runs a job another live
+# process is still working on. The table itself is created by migrations.py.
+
+POLL_INTERVAL = 2.0
+JOB_LEASE = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+HEARTBEAT_INTERVAL = JOB_LEASE / 4
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+_handlers = {}
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+_running = set()
+_running_lock = threading.Lock()
+
+
+def register(kind):
+    """Decorator registering fn(job_id, payload) as the handler for a job kind."""
+    def wrap(fn):
+        _handlers[kind] = fn
+        return fn
+    return wrap
+
+
+def enqueue(kind, payload, user=None, chat_id=None):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO jobs (kind, user, chat_id, payload) VALUES (?, ?, ?, ?)",
+        (kind, user, chat_id, json.dumps(payload))
+    )
+    job_id = cur.lastrowid
+    conn.commit()
+    conn.close()
+
+    _wakeup.set()
+    return job_id
+
+
+def get_job(job_id):
+    conn = get_db_connection()
+    row = conn.execute("""
+        SELECT id, kind, user, chat_id, status, progress, result, error,
+               created_at, started_at, finished_at
+        FROM jobs
+        WHERE id = ?
+    """, (job_id,)).fetchone()
+    conn.close()
+
+    if not row:
+        return None
+
+    return {
+        "id": row[0],
+        "kind": row[1],
+        "user": row[2],
+        "chat_id": row[3],
+        "status": row[4],
+        "progress": json.loads(row[5]) if row[5] else {},
+        "result": json.loads(row[6]) if row[6] else None,
+        "error": row[7],
+        "created_at": row[8],
+        "started_at": row[9],
+        "finished_at": row[10]
+    }
+
+
+def find_active(kind, user, chat_id=None):
+    """Id of a queued or running job of this kind for user (and chat_id, if given), if any."""
+    conn = get_db_connection()
+    row = conn.execute("""
+        SELECT id FROM jobs
+        WHERE kind = ? AND user = ? AND status IN ('queued', 'running')
+          AND (? IS NULL OR chat_id = ?)
+        ORDER BY id DESC
+        LIMIT 1
+    """, (kind, user, chat_id, chat_id)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def update_progress(job_id, progress):
+    conn = get_db_connection()
+    conn.execute("UPDATE jobs SET progress=? WHERE id=?", (json.dumps(progress), job_id))
+    conn.commit()
+    conn.close()
+
+
+def _requeue_expired(conn):
+    """Put running jobs whose owner stopped renewing the lease back in the queue."""
+    now = time.time()
+    expired = conn.execute(
+        "SELECT id FROM jobs WHERE status='running' AND (lease_until IS NULL OR lease_until < ?)",
+        (now,)
+    ).fetchall()
+    if not expired:
+        return
+
+    # the lease condition is re-checked so a job renewed meanwhile stays put
+    conn.executemany(
+        "UPDATE jobs SET status='queued', started_at=NULL, owner=NULL, lease_until=NULL "
+        "WHERE id=? AND status='running' AND (lease_until IS NULL OR lease_until < ?)",
+        [(row[0], now) for row in expired]
+    )
+    conn.commit()
+
+
+def _claim_next():
+    conn = get_db_connection()
+    try:
+        _requeue_expired(conn)
+        while True:
+            row = conn.execute(
+                "SELECT id, kind, payload FROM jobs WHERE status='queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if not row:
+                return None
+
+            claimed = conn.execute(
+                "UPDATE jobs SET status='running', started_at=CURRENT_TIMESTAMP, owner=?, lease_until=? "
+                "WHERE id=? AND status='queued'",
+                (OWNER, time.time() + JOB_LEASE, row[0])
+            ).rowcount
+            conn.commit()
+
+            # Another worker won the race; look for the next one
+            if claimed:
+                return row[0], row[1], json.loads(row[2] or "{}")
+    finally:
+        conn.close()
+
+
+def _finish(job_id, status, result=None, error=None):
+    conn = get_db_connection()
+    # a job whose lease was lost has been handed to another worker; leave it to that one
+    conn.execute(
+        "UPDATE jobs SET status=?, result=?, error=?, finished_at=CURRENT_TIMESTAMP, lease_until=NULL "
+        "WHERE id=? AND owner=?",
+        (status, json.dumps(result) if result is not None else None, error, job_id, OWNER)
+    )
+    conn.commit()
+    conn.close()
+
+
+def _run(job_id, kind, payload):
+    handler = _handlers.get(kind)
+    if handler is None:
+        _finish(job_id, "failed", error=f"No handler for job kind '{kind}'")
+        return
+
+    with _running_lock:
+        _running.add(job_id)
+    try:
+        result = handler(job_id, payload)
+        _finish(job_id, "done", result=result)
+    except Exception as e:
+        traceback.print_exc()
+        _finish(job_id, "failed", error=str(e))
+    finally:
+        with _running_lock:
+            _running.discard(job_id)
+
+
+def _worker_loop():
+    while True:
+        try:
+            job = _claim_next()
+        except Exception as e:
+            print("Job queue error:", e)
+            job = None
+
+        if job is None:
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+
+        _run(*job)
+
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        with _running_lock:
+            running = list(_running)
+        if not running:
+            continue
+        try:
+            conn = get_db_connection()
+            conn.executemany(
+                "UPDATE jobs SET lease_until=? WHERE id=? AND owner=? AND status='running'",
+                [(time.time() + JOB_LEASE, job_id, OWNER) for job_id in running]
+            )
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print("Job heartbeat error:", e)
+
+
+def start_workers(count=2):
+    """Start the worker threads (and the lease heartbeat) once per process."""
+    with _workers_lock:
+        if not _workers:
+            threading.Thread(target=_heartbeat_loop, name="job-heartbeat", daemon=True).start()
+        while len(_workers) < count:
+            t = threading.Thread(target=_worker_loop, name=f"job-worker-{len(_workers)}", daemon=True)
+            t.start()
+            _workers.append(t)
@@ -0,0 +1,152 @@
+import base64
+import json
+
+from db import get_db_connection
+
+# ===============================
+# PAGINATED LEAD LISTS
+# ===============================
+# Lead tables are served a page at a time with keyset (cursor) pagination:
+# each page continues strictly after the sort key of the last row sent, so
+# page 50 costs the same as page 1 and rows added meanwhile never shift the
+# pages. Every sort walks a (chat_id, key, id) index on project_leads (see
+# migration 9); the "status" sort is the overview order — call-for-action
+# first, then declined, then the rest — read as three index ranges in turn.
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+_COLUMNS = """l.id, e.name, e.website, e.phone, e.address, e.rating,
+       e.description, e.email, e.ceo, e.company_linkedin, e.leadership_linkedin,
+       l.status, l.reason"""
+
+_FIELDS = [
+    "id", "name", "website", "phone", "address", "rating",
+    "description", "email", "ceo", "company_linkedin", "leadership_linkedin",
+    "status", "reason",
+]
+
+STATUS_FILTERS = {
+    "cta": "l.status = 'cta'",
+    "declined": "l.status = 'declined'",
+    "explore": "(l.status IS NULL OR l.status NOT IN ('cta', 'declined'))",
+}
+
+# sort name -> segments of (status, key columns, direction), read in order
+SORTS = {
+    "added": [(None, ("l.id",), "ASC")],
+    "rating": [(None, ("l.rating_value", "l.id"), "DESC")],
+    "status": [
+        ("cta", ("l.status_at", "l.id"), "DESC"),
+        ("declined", ("l.status_at", "l.id"), "DESC"),
+        ("explore", ("l.id",), "ASC"),
+    ],
+}
+
+
+def encode_cursor(segment, key):
+    raw = json.dumps([segment] + list(key), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, segments):
+    """(segment, key) from a cursor string; (0, None) when there is none.
+
+    Raises ValueError for a cursor that is malformed or was issued for a
+    different sort (wrong segment index or key length).
+    """
+    if not cursor:
+        return 0, None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        index, key = int(values[0]), values[1:]
+    except (ValueError, TypeError, IndexError, KeyError):
+        raise ValueError("invalid cursor")
+
+    if not 0 <= index < len(segments):
+        raise ValueError("invalid cursor")
+    # an empty key means "start of this segment"
+    if key and len(key) != len(segments[index][1]):
+        raise ValueError("invalid cursor")
+    if not all(isinstance(v, (str, int, float)) and not isinstance(v, bool) for v in key):
+        raise ValueError("invalid cursor")
+    return index, key
+
+
+def _segment_rows(conn, chat_id, segment, key, filters, limit):
+    status, columns, direction = segment
+
+    where = ["l.chat_id = ?"]
+    params = [chat_id]
+    if status:
+        where.append(STATUS_FILTERS[status])
+    if filters.get("status") and filters["status"] != status:
+        where.append(STATUS_FILTERS[filters["status"]])
+    if filters.get("has_email"):
+        where.append("l.has_email = 1")
+    if filters.get("min_rating"):
+        where.append("l.rating_value >= ?")
+        params.append(filters["min_rating"])
+    if key:
+        op = ">" if direction == "ASC" else "<"
+        where.append(f"({', '.join(columns)}) {op} ({', '.join('?' * len(columns))})")
+        params.extend(key)
+
+    order = ", ".join(f"{c} {direction}" for c in columns)
+    rows = conn.execute(f"""
+        SELECT {_COLUMNS}, {", ".join(columns)}
+        FROM project_leads l
+        JOIN company_entities e ON e.id = l.entity_id
+        WHERE {" AND ".join(where)}
+        ORDER BY {order}
+        LIMIT ?
+    """, params + [limit]).fetchall()
+
+    width = len(_FIELDS)
+    return [(dict(zip(_FIELDS, r[:width])), list(r[width:])) for r in rows]
+
+
+def page(chat_id, sort="added", cursor=None, status=None, has_email=False, min_rating=None,
+         limit=PAGE_SIZE):
+    """One page of a project's leads: {"leads": [...], "next": cursor or None}.
+
+    Ownership of chat_id is the caller's check. Raises ValueError for a
+    cursor that does not belong to this sort.
+    """
+    segments = SORTS.get(sort, SORTS["added"])
+    filters = {
+        "status": status if status in STATUS_FILTERS else None,
+        "has_email": has_email,
+        "min_rating": min_rating,
+    }
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    index, key = decode_cursor(cursor, segments)
+    leads = []
+    next_cursor = None
+
+    conn = get_db_connection()
+    while index < len(segments):
+        seg_status = segments[index][0]
+        # a status filter rules out the other fixed-status segments entirely
+        if filters["status"] and seg_status and seg_status != filters["status"]:
+            index, key = index + 1, None
+            continue
+
+        want = limit - len(leads)
+        rows = _segment_rows(conn, chat_id, segments[index], key, filters, want + 1)
+        leads.extend(lead for lead, _ in rows[:want])
+
+        if len(rows) > want:
+            next_cursor = encode_cursor(index, rows[want - 1][1])
+            break
+        if len(leads) == limit:
+            # page filled exactly at the end of this segment
+            if index + 1 < len(segments):
+                next_cursor = encode_cursor(index + 1, [])
+            break
+        index, key = index + 1, None
+    conn.close()
+
+    return {"leads": leads, "next": next_cursor}
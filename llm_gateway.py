@@ -0,0 +1,195 @@
+import os
+import re
+import threading
+import time
+
+from dotenv import load_dotenv
+from groq import Groq
+
+from response_cache import ResponseCache
+
+load_dotenv()
+
+# ===============================
+# LLM GATEWAY
+# ===============================
+# Every Groq call in the app goes through complete(). Responses are stored in
+# a content-addressed cache keyed on (backend, model, messages, temperature,
+# max_tokens), so the same prompt is only sent upstream once per TTL, and
+# concurrent identical prompts share one upstream call. stream() yields the
+# reply as it is generated (never cached). Latency and token usage are
+# recorded per call site. The backend is pluggable: set_backend()
+# swaps Groq for e.g. FakeBackend to run without network access.
+
+DEFAULT_MODEL = "llama-3.1-8b-instant"
+
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+
+llm_cache = ResponseCache("llm_cache", LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES)
+
+
+class GroqBackend:
+
+    name = "groq"
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key or os.getenv("GROQ_API_KEY")
+        self._client = None
+
+    def complete(self, model, messages, temperature, max_tokens):
+        if self._client is None:
+            if not self.api_key:
+                raise ValueError("GROQ_API_KEY not found. Check your .env file.")
+            self._client = Groq(api_key=self.api_key)
+
+        kwargs = {"model": model, "messages": messages, "temperature": temperature}
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+
+        completion = self._client.chat.completions.create(**kwargs)
+        usage = completion.usage
+        return {
+            "content": completion.choices[0].message.content,
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        }
+
+    def stream(self, model, messages, temperature, max_tokens, usage):
+        """Yield content deltas; fills the usage dict from the final chunk."""
+        if self._client is None:
+            if not self.api_key:
+                raise ValueError("GROQ_API_KEY not found. Check your .env file.")
+            self._client = Groq(api_key=self.api_key)
+
+        kwargs = {"model": model, "messages": messages, "temperature": temperature, "stream": True}
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+
+        for chunk in self._client.chat.completions.create(**kwargs):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+            final = getattr(getattr(chunk, "x_groq", None), "usage", None)
+            if final is not None:
+                usage["prompt_tokens"] = getattr(final, "prompt_tokens", 0) or 0
+                usage["completion_tokens"] = getattr(final, "completion_tokens", 0) or 0
+
+
+class FakeBackend:
+    """Local stand-in: reply(messages) -> text. Token counts are word counts."""
+
+    name = "fake"
+
+    def __init__(self, reply=None):
+        self.reply = reply or (lambda messages: "[]")
+        self.calls = 0
+
+    def complete(self, model, messages, temperature, max_tokens):
+        self.calls += 1
+        content = self.reply(messages)
+        return {
+            "content": content,
+            "prompt_tokens": sum(len(str(m.get("content", "")).split()) for m in messages),
+            "completion_tokens": len(content.split()),
+        }
+
+    def stream(self, model, messages, temperature, max_tokens, usage):
+        response = self.complete(model, messages, temperature, max_tokens)
+        usage.update(prompt_tokens=response["prompt_tokens"], completion_tokens=response["completion_tokens"])
+        for word in re.findall(r"\S+\s*|\s+", response["content"]):
+            yield word
+
+
+_backend = GroqBackend()
+_lock = threading.Lock()
+_stats = {}
+
+
+def set_backend(backend):
+    """Replace the backend; returns the previous one."""
+    global _backend
+    previous, _backend = _backend, backend
+    return previous
+
+
+def _record(label, latency=None, usage=None, error=False, first_token=None):
+    with _lock:
+        s = _stats.setdefault(label, {
+            "calls": 0, "upstream": 0, "errors": 0, "latency_ms": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0,
+        })
+        if first_token is not None:
+            s["first_token_ms"] = s.get("first_token_ms", 0.0) + first_token * 1000
+        if latency is None and not error:
+            s["calls"] += 1
+            return
+        if error:
+            s["errors"] += 1
+            return
+        s["upstream"] += 1
+        s["latency_ms"] += latency * 1000
+        s["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        s["completion_tokens"] += usage.get("completion_tokens", 0)
+
+
+def complete(messages, model=DEFAULT_MODEL, temperature=0.0, max_tokens=None, label="llm", cache=True):
+    """Return the model's reply text for messages.
+
+    label groups the call in stats(); cache=False always goes upstream
+    (for conversational replies that should never repeat).
+    """
+    backend = _backend
+    _record(label)
+
+    def load():
+        started = time.perf_counter()
+        try:
+            response = backend.complete(model, messages, temperature, max_tokens)
+        except Exception:
+            _record(label, error=True)
+            raise
+        _record(label, time.perf_counter() - started, response)
+        return response
+
+    if not cache:
+        return load()["content"]
+
+    params = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    return llm_cache.fetch(backend.name, params, load, lambda r: bool(r.get("content")))["content"]
+
+
+def stream(messages, model=DEFAULT_MODEL, temperature=0.0, max_tokens=None, label="llm"):
+    """Yield the reply in pieces as the backend produces them (uncached)."""
+    backend = _backend
+    _record(label)
+
+    usage = {}
+    started = time.perf_counter()
+    first_token = None
+    try:
+        for piece in backend.stream(model, messages, temperature, max_tokens, usage):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            yield piece
+    except Exception:
+        _record(label, error=True)
+        raise
+
+    _record(label, time.perf_counter() - started, usage, first_token=first_token or 0.0)
+
+
+def stats():
+    with _lock:
+        calls = {label: dict(s) for label, s in _stats.items()}
+    for s in calls.values():
+        s["avg_latency_ms"] = round(s["latency_ms"] / s["upstream"], 1) if s["upstream"] else 0.0
+        s["latency_ms"] = round(s["latency_ms"], 1)
+        if "first_token_ms" in s:
+            s["avg_first_token_ms"] = round(s.pop("first_token_ms") / s["upstream"], 1) if s["upstream"] else 0.0
+    return {"cache": llm_cache.stats(), "calls": calls}
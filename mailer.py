@@ -0,0 +1,329 @@
+import os
+import smtplib
+import ssl
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from db import get_db_connection
+from http_client import RateLimiter
+
+# ===============================
+# OUTBOUND MAIL QUEUE
+# ===============================
+# Emails are written to the `outbox` table and delivered by one background
+# worker that keeps a single authenticated SMTP connection open and sends
+# due messages over it in batches. Sends are throttled to SMTP_MAX_PER_MINUTE.
+# Temporary failures (4xx, dropped connections) are retried with exponential
+# backoff; permanent ones (5xx, refused recipient) mark the message failed.
+# A worker claims rows with a conditional UPDATE, as jobs.py does, so several
+# processes can share the outbox. While a row is 'sending', next_attempt_at
+# is the claim's deadline: a row whose worker died becomes due again then.
+# STARTTLS (with certificate checks) is required whenever a password is set,
+# so a downgraded connection fails instead of sending it in the clear. To
+# test against a local debugging server (e.g. aiosmtpd) without a real
+# mailbox, set SMTP_STARTTLS=0 and leave SENDER_PASSWORD empty.
+
+SMTP_BATCH = int(os.getenv("SMTP_BATCH", "20"))
+SMTP_MAX_PER_MINUTE = int(os.getenv("SMTP_MAX_PER_MINUTE", "30"))
+SMTP_MAX_ATTEMPTS = int(os.getenv("SMTP_MAX_ATTEMPTS", "5"))
+SMTP_RETRY_BASE = float(os.getenv("SMTP_RETRY_BASE", "30"))     # seconds, doubled per attempt
+SMTP_RETRY_MAX = 3600
+SMTP_IDLE_TIMEOUT = 60      # close the connection after this long without mail
+SMTP_CLAIM_TIMEOUT = 600    # a batch still 'sending' after this belongs to a dead worker
+POLL_INTERVAL = 5
+
+_limiter = RateLimiter(SMTP_MAX_PER_MINUTE)
+_wake = threading.Event()
+_worker = None
+
+
+def config():
+    return {
+        "server": os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+        "port": int(os.getenv("SMTP_PORT", "587")),
+        "sender": os.getenv("SENDER_EMAIL"),
+        "password": os.getenv("SENDER_PASSWORD"),
+        "starttls": os.getenv("SMTP_STARTTLS", "1") != "0",
+    }
+
+
+def is_configured():
+    return bool(config()["sender"])
+
+
+def enqueue(user, recipient, subject, body, company_name="", draft_id=None):
+    """Queue one email; returns its outbox id. Delivery happens in the worker."""
+    conn = get_db_connection()
+    cur = conn.execute("""
+        INSERT INTO outbox (user, recipient, subject, body, company_name, draft_id, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (user, recipient, subject, body, company_name, draft_id, time.time()))
+    conn.commit()
+    conn.close()
+
+    _wake.set()
+    return cur.lastrowid
+
+
+def enqueue_drafts(user, chat_id):
+    """Queue every finished draft of a project whose lead has an email.
+
+    Drafts already queued or sent are skipped; returns the number queued.
+    """
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT d.id, c.email, d.subject, d.body, c.name
+        FROM newsletter_drafts d
+        JOIN companies c ON c.id = d.lead_id
+        WHERE d.user = ? AND d.chat_id = ? AND d.status = 'done'
+          AND c.email IS NOT NULL AND c.email != ''
+          AND NOT EXISTS (
+              SELECT 1 FROM outbox o WHERE o.draft_id = d.id AND o.status != 'failed'
+          )
+    """, (user, chat_id)).fetchall()
+
+    now = time.time()
+    conn.executemany("""
+        INSERT INTO outbox (user, recipient, subject, body, company_name, draft_id, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [(user, email, subject, body, name, draft_id, now) for draft_id, email, subject, body, name in rows])
+    conn.commit()
+    conn.close()
+
+    if rows:
+        _wake.set()
+    return len(rows)
+
+
+def get_status(user, outbox_id):
+    conn = get_db_connection()
+    row = conn.execute("""
+        SELECT id, recipient, company_name, status, attempts, last_error, sent_at
+        FROM outbox WHERE id = ? AND user = ?
+    """, (outbox_id, user)).fetchone()
+    conn.close()
+
+    if not row:
+        return None
+    return {
+        "id": row[0],
+        "recipient": row[1],
+        "company_name": row[2],
+        "status": row[3],
+        "attempts": row[4],
+        "error": row[5],
+        "sent_at": row[6],
+    }
+
+
+def counts(user, chat_id):
+    """{status: n} for the outbox rows sent from a project's drafts."""
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT o.status, COUNT(*)
+        FROM outbox o
+        JOIN newsletter_drafts d ON d.id = o.draft_id
+        WHERE o.user = ? AND d.chat_id = ?
+        GROUP BY o.status
+    """, (user, chat_id)).fetchall()
+    conn.close()
+    return dict(rows)
+
+
+# ---------------------
+# Delivery worker
+# ---------------------
+
+def _build_message(sender, recipient, subject, body):
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = sender
+    msg["To"] = recipient
+    msg.attach(MIMEText(body, "plain"))
+    return msg
+
+
+def _connect(cfg):
+    server = smtplib.SMTP(cfg["server"], cfg["port"], timeout=30)
+    server.ehlo()
+    if cfg["starttls"] and (cfg["password"] or server.has_extn("starttls")):
+        # raises SMTPNotSupportedError when STARTTLS is not offered (or was stripped)
+        server.starttls(context=ssl.create_default_context())
+        server.ehlo()
+    if cfg["password"]:
+        server.login(cfg["sender"], cfg["password"])
+    return server
+
+
+def _alive(server):
+    try:
+        return server.noop()[0] == 250
+    except smtplib.SMTPException:
+        return False
+    except OSError:
+        return False
+
+
+def _close(server):
+    try:
+        server.quit()
+    except Exception:
+        pass
+
+
+def _due(conn, limit):
+    return conn.execute("""
+        SELECT id, recipient, subject, body, attempts
+        FROM outbox
+        WHERE status IN ('queued', 'retry', 'sending') AND next_attempt_at <= ?
+        ORDER BY next_attempt_at, id
+        LIMIT ?
+    """, (time.time(), limit)).fetchall()
+
+
+def _claim(conn, batch):
+    """Mark due rows 'sending' for this worker; returns the rows it won."""
+    now = time.time()
+    claimed = []
+    for row in batch:
+        # still due means no other worker claimed it since _due() read it
+        won = conn.execute("""
+            UPDATE outbox SET status = 'sending', next_attempt_at = ?
+            WHERE id = ? AND status IN ('queued', 'retry', 'sending') AND next_attempt_at <= ?
+        """, (now + SMTP_CLAIM_TIMEOUT, row[0], now)).rowcount
+        if won == 1:
+            claimed.append(row)
+    conn.commit()
+    return claimed
+
+
+def _next_wait(conn):
+    """Seconds until the next retry is due, capped at POLL_INTERVAL."""
+    row = conn.execute(
+        "SELECT MIN(next_attempt_at) FROM outbox WHERE status IN ('queued', 'retry', 'sending')"
+    ).fetchone()
+    if row[0] is None:
+        return POLL_INTERVAL
+    return min(POLL_INTERVAL, max(0.05, row[0] - time.time()))
+
+
+def _mark(conn, outbox_id, status, attempts, error=None):
+    if status == "retry":
+        if attempts >= SMTP_MAX_ATTEMPTS:
+            status = "failed"
+        delay = min(SMTP_RETRY_MAX, SMTP_RETRY_BASE * 2 ** (attempts - 1))
+    else:
+        delay = 0
+
+    conn.execute("""
+        UPDATE outbox
+        SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?,
+            sent_at = CASE WHEN ? = 'sent' THEN CURRENT_TIMESTAMP ELSE sent_at END
+        WHERE id = ?
+    """, (status, attempts, error, time.time() + delay, status, outbox_id))
+    conn.commit()
+
+
+def _permanent(error):
+    """5xx replies are final; 4xx (e.g. greylisting) are worth retrying."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    code = getattr(error, "smtp_code", None)
+    return code is not None and 500 <= code < 600
+
+
+def _deliver(server, cfg, conn, batch):
+    """Send one batch over server; returns False if the connection is unusable."""
+    for outbox_id, recipient, subject, body, attempts in batch:
+        attempts += 1
+        _limiter.acquire()
+        try:
+            refused = server.send_message(_build_message(cfg["sender"], recipient, subject, body))
+            if refused:
+                code, reason = refused.get(recipient, (550, b"refused"))
+                _mark(conn, outbox_id, "failed", attempts, f"{code} {reason!r}")
+            else:
+                _mark(conn, outbox_id, "sent", attempts)
+        except smtplib.SMTPServerDisconnected as e:
+            _mark(conn, outbox_id, "retry", attempts, str(e) or repr(e))
+            return False
+        except smtplib.SMTPException as e:
+            _mark(conn, outbox_id, "failed" if _permanent(e) else "retry", attempts, str(e))
+            try:
+                server.rset()
+            except Exception:
+                return False
+        except OSError as e:
+            # socket-level failure (SMTPException is itself an OSError, so this comes last)
+            _mark(conn, outbox_id, "retry", attempts, str(e) or repr(e))
+            return False
+    return True
+
+
+def _run():
+    server = None
+    last_used = 0.0
+
+    while True:
+        try:
+            conn = get_db_connection()
+            batch = _due(conn, SMTP_BATCH)
+            cfg = config()
+
+            if not batch or not cfg["sender"]:
+                if server is not None and time.time() - last_used > SMTP_IDLE_TIMEOUT:
+                    _close(server)
+                    server = None
+                _wake.wait(_next_wait(conn))
+                _wake.clear()
+                continue
+
+            batch = _claim(conn, batch)
+            if not batch:
+                continue
+
+            try:
+                if server is None or not _alive(server):
+                    server = _connect(cfg)
+            except Exception as e:
+                # cannot reach or log in: the whole batch waits for the next attempt
+                print("SMTP connect error:", e)
+                for outbox_id, _, _, _, attempts in batch:
+                    _mark(conn, outbox_id, "retry", attempts + 1, f"connect: {e}")
+                server = None
+                continue
+
+            if not _deliver(server, cfg, conn, batch):
+                _close(server)
+                server = None
+
+            # the rest of a batch cut short by a dropped connection goes back in line
+            conn.executemany(
+                "UPDATE outbox SET status = 'retry', next_attempt_at = ? WHERE id = ? AND status = 'sending'",
+                [(time.time(), row[0]) for row in batch]
+            )
+            conn.commit()
+            last_used = time.time()
+        except Exception as e:
+            # e.g. "database is locked" during a long write; keep the only mail thread alive
+            print("Mail worker error:", e)
+            if server is not None:
+                _close(server)
+                server = None
+            time.sleep(POLL_INTERVAL)
+
+
+def start_worker():
+    """Start the delivery thread once per process.
+
+    Rows left 'sending' by a crashed worker are picked up again once their
+    claim expires; rows another live process is sending are left alone.
+    """
+    global _worker
+    if _worker is not None:
+        return
+
+    _worker = threading.Thread(target=_run, name="mailer", daemon=True)
+    _worker.start()
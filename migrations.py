@@ -0,0 +1,655 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import company_store
+from db import get_db_connection
+
+# ===============================
+# SCHEMA MIGRATIONS
+# ===============================
+# Ordered, idempotent schema steps. Each one runs once inside its own
+# transaction and is recorded in `schema_version`; databases created before
+# the runner existed are brought up to date by the same steps.
+
+
+def _columns(cur, table):
+    return {row[1] for row in cur.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_columns(cur, table, columns):
+    existing = _columns(cur, table)
+    for name, col_type in columns:
+        if name not in existing:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+
+
+def _base_schema(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS companies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        website TEXT,
+        phone TEXT,
+        address TEXT,
+        rating TEXT,
+        chat_id INTEGER
+    )
+    """)
+    _add_columns(cur, "companies", [
+        ("description", "TEXT"),
+        ("email", "TEXT"),
+        ("ceo", "TEXT"),
+        ("company_linkedin", "TEXT"),
+        ("leadership_linkedin", "TEXT"),
+        ("status", "TEXT"),
+        ("reason", "TEXT"),
+        ("cta_at", "TEXT"),
+        ("declined_at", "TEXT"),
+        ("chat_id", "INTEGER"),
+    ])
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE,
+        password TEXT
+    )
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS chats (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user TEXT,
+        title TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER,
+        role TEXT,
+        content TEXT,
+        timestamp DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER,
+        product_name TEXT,
+        description TEXT,
+        industry TEXT,
+        location TEXT,
+        industry_suggestions TEXT
+    )
+    """)
+    _add_columns(cur, "products", [("industry_suggestions", "TEXT")])
+
+
+def _lookup_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_companies_chat_status ON companies(chat_id, status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages(chat_id, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chats_user_id ON chats(user, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_products_chat_id ON products(chat_id)")
+
+
+def _companies_fts(cur):
+    # External-content FTS5 index over companies, kept in sync by triggers.
+    # Builds without FTS5 skip this and search falls back to LIKE.
+    try:
+        cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS companies_fts USING fts5(
+            name, description, address,
+            content='companies', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """)
+    except sqlite3.OperationalError as e:
+        print("FTS5 unavailable, skipping companies_fts:", e)
+        return
+
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS companies_fts_ai AFTER INSERT ON companies BEGIN
+        INSERT INTO companies_fts(rowid, name, description, address)
+        VALUES (new.id, new.name, new.description, new.address);
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS companies_fts_ad AFTER DELETE ON companies BEGIN
+        INSERT INTO companies_fts(companies_fts, rowid, name, description, address)
+        VALUES ('delete', old.id, old.name, old.description, old.address);
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS companies_fts_au AFTER UPDATE OF name, description, address ON companies BEGIN
+        INSERT INTO companies_fts(companies_fts, rowid, name, description, address)
+        VALUES ('delete', old.id, old.name, old.description, old.address);
+        INSERT INTO companies_fts(rowid, name, description, address)
+        VALUES (new.id, new.name, new.description, new.address);
+    END
+    """)
+    cur.execute("INSERT INTO companies_fts(companies_fts) VALUES ('rebuild')")
+
+
+def _company_entities(cur):
+    # Split the flat per-project `companies` table into one global
+    # company_entities row per business plus project_leads links, then put a
+    # `companies` view with the old columns in its place.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS company_entities (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity_key TEXT UNIQUE NOT NULL,
+        name TEXT,
+        website TEXT,
+        phone TEXT,
+        address TEXT,
+        rating TEXT,
+        description TEXT,
+        email TEXT,
+        ceo TEXT,
+        company_linkedin TEXT,
+        leadership_linkedin TEXT,
+        enriched_at TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS project_leads (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        status TEXT,
+        reason TEXT,
+        cta_at TEXT,
+        declined_at TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(chat_id, entity_id)
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_project_leads_chat_status ON project_leads(chat_id, status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_project_leads_entity ON project_leads(entity_id)")
+
+    for trigger in ("companies_fts_ai", "companies_fts_ad", "companies_fts_au"):
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cur.execute("DROP TABLE IF EXISTS companies_fts")
+
+    # Older rows first so newer scrapes win when merged into one entity;
+    # rows the user already qualified win the per-project link.
+    legacy = cur.execute(f"""
+        SELECT id, chat_id, status, reason, cta_at, declined_at,
+               {", ".join(company_store.ENTITY_FIELDS)}
+        FROM companies
+        ORDER BY id ASC
+    """).fetchall()
+
+    companies = []
+    for row in legacy:
+        c = dict(zip(company_store.ENTITY_FIELDS, row[6:]))
+        # old rows were always enriched when saved
+        c["enriched_at"] = "1970-01-01 00:00:00"
+        companies.append(c)
+    ids = company_store.upsert_entities(cur, companies)
+
+    links = []
+    for r in sorted(legacy, key=lambda r: (r[2] is None, r[0])):
+        if r[1] is None:
+            continue
+        key = company_store.entity_key(dict(zip(company_store.ENTITY_FIELDS, r[6:])))
+        links.append((r[0], ids[key], r[1], r[2], r[3], r[4], r[5]))
+
+    cur.executemany("""
+        INSERT OR IGNORE INTO project_leads
+            (id, entity_id, chat_id, status, reason, cta_at, declined_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, links)
+
+    cur.execute("DROP TABLE companies")
+    cur.execute("""
+    CREATE VIEW companies AS
+    SELECT l.id, e.name, e.website, e.phone, e.address, e.rating,
+           e.description, e.email, e.ceo, e.company_linkedin, e.leadership_linkedin,
+           l.status, l.reason, l.cta_at, l.declined_at, l.chat_id,
+           l.entity_id, l.created_at
+    FROM project_leads l
+    JOIN company_entities e ON e.id = l.entity_id
+    """)
+
+    try:
+        cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS company_entities_fts USING fts5(
+            name, description, address,
+            content='company_entities', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """)
+    except sqlite3.OperationalError as e:
+        print("FTS5 unavailable, skipping company_entities_fts:", e)
+        return
+
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS company_entities_fts_ai AFTER INSERT ON company_entities BEGIN
+        INSERT INTO company_entities_fts(rowid, name, description, address)
+        VALUES (new.id, new.name, new.description, new.address);
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS company_entities_fts_ad AFTER DELETE ON company_entities BEGIN
+        INSERT INTO company_entities_fts(company_entities_fts, rowid, name, description, address)
+        VALUES ('delete', old.id, old.name, old.description, old.address);
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS company_entities_fts_au AFTER UPDATE OF name, description, address ON company_entities BEGIN
+        INSERT INTO company_entities_fts(company_entities_fts, rowid, name, description, address)
+        VALUES ('delete', old.id, old.name, old.description, old.address);
+        INSERT INTO company_entities_fts(rowid, name, description, address)
+        VALUES (new.id, new.name, new.description, new.address);
+    END
+    """)
+    cur.execute("INSERT INTO company_entities_fts(company_entities_fts) VALUES ('rebuild')")
+
+
+def _company_project_matches(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS company_project_matches (
+        user TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        company_name TEXT,
+        projects TEXT,
+        input_hash TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user, entity_id)
+    )
+    """)
+
+
+def _chat_memory(cur):
+    _add_columns(cur, "messages", [("plain", "TEXT"), ("tokens", "INTEGER")])
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS chat_summaries (
+        chat_id INTEGER PRIMARY KEY,
+        summary TEXT,
+        upto_message_id INTEGER DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+
+def _newsletter_drafts(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS newsletter_drafts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user TEXT,
+        chat_id INTEGER,
+        lead_id INTEGER,
+        status TEXT DEFAULT 'pending',
+        subject TEXT,
+        body TEXT,
+        attempts INTEGER DEFAULT 0,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(chat_id, lead_id)
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_newsletter_drafts_lead ON newsletter_drafts(lead_id)")
+
+
+def _outbox(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user TEXT,
+        recipient TEXT,
+        subject TEXT,
+        body TEXT,
+        company_name TEXT,
+        draft_id INTEGER,
+        status TEXT DEFAULT 'queued',
+        attempts INTEGER DEFAULT 0,
+        last_error TEXT,
+        next_attempt_at REAL,
+        sent_at TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_draft ON outbox(draft_id)")
+
+
+# Lead-list sort keys derived from the entity, in SQL so triggers can reuse them
+_RATING_KEY = "CASE WHEN {e}.rating GLOB '[0-9]*' THEN CAST({e}.rating AS REAL) ELSE 0 END"
+_EMAIL_KEY = "CASE WHEN {e}.email LIKE '%_@_%' THEN 1 ELSE 0 END"
+_STATUS_KEY = """CASE {l}.status WHEN 'cta' THEN COALESCE({l}.cta_at, '')
+                     WHEN 'declined' THEN COALESCE({l}.declined_at, '') ELSE '' END"""
+
+
+def _lead_list_keys(cur):
+    # Copies of the entity's rating/email and of the status timestamp on each
+    # project_leads row, so lead tables can be filtered, sorted and
+    # keyset-paginated from (chat_id, key, id) indexes. Triggers keep them in
+    # step with company_entities and with status changes.
+    _add_columns(cur, "project_leads", [
+        ("rating_value", "REAL NOT NULL DEFAULT 0"),
+        ("has_email", "INTEGER NOT NULL DEFAULT 0"),
+        ("status_at", "TEXT NOT NULL DEFAULT ''"),
+    ])
+
+    cur.execute(f"""
+        UPDATE project_leads
+        SET rating_value = (SELECT {_RATING_KEY.format(e="e")} FROM company_entities e WHERE e.id = project_leads.entity_id),
+            has_email = (SELECT {_EMAIL_KEY.format(e="e")} FROM company_entities e WHERE e.id = project_leads.entity_id),
+            status_at = {_STATUS_KEY.format(l="project_leads")}
+    """)
+
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS project_leads_keys_ai AFTER INSERT ON project_leads BEGIN
+        UPDATE project_leads
+        SET rating_value = (SELECT {_RATING_KEY.format(e="e")} FROM company_entities e WHERE e.id = new.entity_id),
+            has_email = (SELECT {_EMAIL_KEY.format(e="e")} FROM company_entities e WHERE e.id = new.entity_id),
+            status_at = {_STATUS_KEY.format(l="new")}
+        WHERE id = new.id;
+    END
+    """)
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS project_leads_keys_au AFTER UPDATE OF status, cta_at, declined_at ON project_leads BEGIN
+        UPDATE project_leads SET status_at = {_STATUS_KEY.format(l="new")} WHERE id = new.id;
+    END
+    """)
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS company_entities_keys_au AFTER UPDATE OF rating, email ON company_entities BEGIN
+        UPDATE project_leads
+        SET rating_value = {_RATING_KEY.format(e="new")}, has_email = {_EMAIL_KEY.format(e="new")}
+        WHERE entity_id = new.id;
+    END
+    """)
+
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_project_leads_chat_id ON project_leads(chat_id, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_project_leads_chat_rating ON project_leads(chat_id, rating_value, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_project_leads_chat_email ON project_leads(chat_id, has_email, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_project_leads_chat_status_at ON project_leads(chat_id, status, status_at, id)")
+
+
+def _entity_phone_index(cur):
+    # Lets targeting match a new Maps result to a stored entity by phone even
+    # when the entity was keyed on its website (and the other way round).
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_company_entities_phone ON company_entities({company_store.PHONE_SQL})")
+
+
+def _lead_threshold(cur):
+    # Per-project target for targeting runs; NULL falls back to LEAD_THRESHOLD
+    _add_columns(cur, "chats", [("lead_threshold", "INTEGER")])
+
+
+def _analysis_markers(cur):
+    # Entities count their updates so /industry_viewed can tell from one
+    # aggregate whether a user's portfolio changed since the last analysis.
+    # A trigger does the counting, so the shared upsert (which migration 4
+    # also runs, before this column exists) never names `revision`.
+    _add_columns(cur, "company_entities", [("revision", "INTEGER NOT NULL DEFAULT 0")])
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS company_entities_revision_au
+    AFTER UPDATE OF name, website, phone, address, rating, description, email, ceo,
+                    company_linkedin, leadership_linkedin, enriched_at ON company_entities BEGIN
+        UPDATE company_entities SET revision = revision + 1 WHERE id = new.id;
+    END
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS portfolio_analysis_state (
+        user TEXT PRIMARY KEY,
+        marker TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+
+def _draft_claims(cur):
+    # The job that claimed a running draft, so only that job (requeued once
+    # its process stops renewing the lease) takes the draft back
+    _add_columns(cur, "newsletter_drafts", [("job_id", "INTEGER")])
+
+
+def _jobs(cur):
+    # Background job queue (jobs.py); owner and lease_until let a live
+    # process keep its running jobs while a dead one's are requeued
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT,
+        user TEXT,
+        chat_id INTEGER,
+        payload TEXT,
+        status TEXT DEFAULT 'queued',
+        progress TEXT,
+        result TEXT,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        owner TEXT,
+        lease_until REAL
+    )
+    """)
+    # databases that created the table before it moved here lack the lease
+    _add_columns(cur, "jobs", [("owner", "TEXT"), ("lease_until", "REAL")])
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)")
+
+
+def _response_caches(cur):
+    # Upstream response caches (response_cache.py) for SerpAPI and the LLM
+    for table in ("serp_cache", "llm_cache"):
+        cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            key TEXT PRIMARY KEY,
+            namespace TEXT,
+            value TEXT,
+            created_at REAL,
+            accessed_at REAL
+        )
+        """)
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_accessed ON {table}(accessed_at)")
+
+
+def _cache_expiry(cur):
+    # Each cache row stores its own expiry, so eviction also purges
+    # namespaces that fall back to the cache's default TTL
+    for table in ("serp_cache", "llm_cache"):
+        _add_columns(cur, table, [("expires_at", "REAL")])
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_expires ON {table}(expires_at)")
+
+
+MIGRATIONS = [
+    (1, "base schema", _base_schema),
+    (2, "lookup indexes", _lookup_indexes),
+    (3, "companies full-text index", _companies_fts),
+    (4, "global company entities", _company_entities),
+    (5, "stored portfolio analysis", _company_project_matches),
+    (6, "conversation memory", _chat_memory),
+    (7, "newsletter drafts", _newsletter_drafts),
+    (8, "mail outbox", _outbox),
+    (9, "lead list sort keys", _lead_list_keys),
+    (10, "entity phone index", _entity_phone_index),
+    (11, "per-project lead threshold", _lead_threshold),
+    (12, "portfolio analysis markers", _analysis_markers),
+    (13, "newsletter draft claims", _draft_claims),
+    (14, "background jobs", _jobs),
+    (15, "response caches", _response_caches),
+    (16, "response cache expiry", _cache_expiry),
+]
+
+
+def migrate(conn=None, upto=None, quiet=False):
+    """Apply pending migrations (up to `upto`); returns the versions applied."""
+    conn = conn or get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.commit()
+
+    done = {row[0] for row in cur.execute("SELECT version FROM schema_version")}
+    applied = []
+
+    for version, name, step in MIGRATIONS:
+        if version in done or (upto is not None and version > upto):
+            continue
+
+        try:
+            cur.execute("BEGIN")
+            step(cur)
+            cur.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        if not quiet:
+            print(f"Applied migration {version}: {name}")
+        applied.append(version)
+
+    return applied
+
+
+# ===============================
+# UPGRADE PATH CHECK
+# ===============================
+# A fresh database only proves the latest code path. check_upgrade_path()
+# builds a throwaway database with the original flat schema and a few leads,
+# then runs every later migration over it, the way an existing install
+# upgrades.
+
+_LEGACY_COMPANIES = [
+    # name, website, phone, address, rating, chat_id, status
+    ("Acme Dental", "https://acme-dental.example.com", "+91 20 1111 2222", "FC Road, Pune", "4.6", 1, None),
+    ("Acme Dental Clinic", "https://www.acme-dental.example.com/", "", "FC Road, Pune", "4.7", 2, "cta"),
+    ("Orbit Logistics", "", "+91 22 3333 4444", "Andheri, Mumbai", "", 1, "declined"),
+]
+
+
+def check_upgrade_path():
+    """Return an error message if upgrading a legacy database fails, else None."""
+    tmp = tempfile.mkdtemp(prefix="upgrade_check_")
+    conn = sqlite3.connect(os.path.join(tmp, "leads.db"))
+    try:
+        migrate(conn, upto=1, quiet=True)
+        conn.execute("INSERT INTO chats (id, user, title) VALUES (1, 'u', 'a'), (2, 'u', 'b')")
+        conn.executemany(
+            "INSERT INTO companies (name, website, phone, address, rating, chat_id, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            _LEGACY_COMPANIES
+        )
+        conn.commit()
+
+        migrate(conn, quiet=True)
+
+        leads = conn.execute("SELECT COUNT(*) FROM companies").fetchone()[0]
+        if leads != len(_LEGACY_COMPANIES):
+            return f"expected {len(_LEGACY_COMPANIES)} leads after upgrade, found {leads}"
+        return None
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    finally:
+        conn.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ===============================
+# QUERY PLAN CHECKS
+# ===============================
+# Hot queries that must stay index-backed. check_query_plans() reports any
+# that fall back to a full table scan (run via `python update_db.py --check`).
+
+HOT_QUERIES = {
+    "dashboard companies": (
+        "SELECT name FROM companies WHERE chat_id = ?", (1,)),
+    "lead page": (
+        "SELECT l.id FROM project_leads l JOIN company_entities e ON e.id = l.entity_id "
+        "WHERE l.chat_id = ? AND (l.id) > (?) ORDER BY l.id ASC LIMIT 51", (1, 0)),
+    "lead page by rating": (
+        "SELECT l.id FROM project_leads l JOIN company_entities e ON e.id = l.entity_id "
+        "WHERE l.chat_id = ? AND (l.rating_value, l.id) < (?, ?) "
+        "ORDER BY l.rating_value DESC, l.id DESC LIMIT 51", (1, 5.0, 0)),
+    "lead page with email": (
+        "SELECT l.id FROM project_leads l JOIN company_entities e ON e.id = l.entity_id "
+        "WHERE l.chat_id = ? AND l.has_email = 1 ORDER BY l.id ASC LIMIT 51", (1,)),
+    "lead page cta first": (
+        "SELECT l.id FROM project_leads l JOIN company_entities e ON e.id = l.entity_id "
+        "WHERE l.chat_id = ? AND l.status = 'cta' ORDER BY l.status_at DESC, l.id DESC LIMIT 51", (1,)),
+    "cta leads by user": (
+        "SELECT ch.id, c.id FROM chats ch "
+        "JOIN companies c ON c.chat_id = ch.id AND c.status = 'cta' "
+        "LEFT JOIN products p ON ch.id = p.chat_id WHERE ch.user = ? ORDER BY ch.id DESC, c.id DESC", ("",)),
+    "cta companies": (
+        "SELECT name FROM companies WHERE chat_id = ? AND status = 'cta' ORDER BY id DESC", (1,)),
+    "due outbox mail": (
+        "SELECT id FROM outbox WHERE status IN ('queued', 'retry', 'sending') AND next_attempt_at <= ? ORDER BY next_attempt_at, id LIMIT 20", (0,)),
+    "chat history tail": (
+        "SELECT id, role, plain, tokens, content FROM messages WHERE chat_id = ? AND id > ? ORDER BY id ASC", (1, 0)),
+    "chat messages": (
+        "SELECT role, content FROM messages WHERE chat_id = ? ORDER BY id ASC", (1,)),
+    "user projects": (
+        "SELECT ch.id, ch.title, p.description FROM chats ch "
+        "LEFT JOIN products p ON ch.id = p.chat_id WHERE ch.user = ? ORDER BY ch.id DESC", ("",)),
+    "entity by phone": (
+        f"SELECT entity_key FROM company_entities WHERE {company_store.PHONE_SQL} IN (?)", ("",)),
+    "stale project leads": (
+        "SELECT e.entity_key FROM project_leads l JOIN company_entities e ON e.id = l.entity_id "
+        "WHERE l.chat_id = ? AND (l.status IS NULL OR l.status != 'declined') "
+        "AND (e.enriched_at IS NULL OR e.enriched_at < ?)", (1, "")),
+    "portfolio marker": (
+        "SELECT COUNT(*), MAX(l.id), TOTAL(e.revision) FROM chats ch "
+        "JOIN project_leads l ON l.chat_id = ch.id "
+        "JOIN company_entities e ON e.id = l.entity_id WHERE ch.user = ?", ("",)),
+    "next queued job": (
+        "SELECT id, kind, payload FROM jobs WHERE status='queued' ORDER BY id LIMIT 1", ()),
+    "expired job leases": (
+        "SELECT id FROM jobs WHERE status='running' AND (lease_until IS NULL OR lease_until < ?)", (0,)),
+    "serp cache lru": (
+        "SELECT key FROM serp_cache ORDER BY accessed_at ASC LIMIT 10", ()),
+    "llm cache lru": (
+        "SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT 10", ()),
+    "expired serp cache": (
+        "SELECT key FROM serp_cache WHERE expires_at < ?", (0,)),
+    "expired llm cache": (
+        "SELECT key FROM llm_cache WHERE expires_at < ?", (0,)),
+    "linked entities": (
+        "SELECT entity_id FROM project_leads WHERE chat_id = ? AND entity_id IN (?)", (1, 1)),
+    "project lead count": (
+        "SELECT COUNT(*) FROM project_leads "
+        "WHERE chat_id = ? AND (status IS NULL OR status != 'declined')", (1,)),
+    "entity by key": (
+        "SELECT id FROM company_entities WHERE entity_key = ?", ("",)),
+    "portfolio analysis": (
+        "SELECT company_name, projects FROM company_project_matches WHERE user = ? ORDER BY company_name", ("",)),
+    "product info": (
+        "SELECT product_name, description FROM products WHERE chat_id = ?", (1,)),
+}
+
+
+def check_query_plans(conn=None):
+    """Return {query_name: plan_lines} for hot queries that do a full scan."""
+    conn = conn or get_db_connection()
+    problems = {}
+
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        scans = [
+            line for line in plan
+            if line.startswith("SCAN") and "USING" not in line
+        ]
+        if scans:
+            problems[name] = plan
+
+    return problems
@@ -0,0 +1,214 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import jobs
+from ai_agent import generate_newsletter_draft
+from db import get_db_connection
+from http_client import RateLimiter
+
+# ===============================
+# BULK NEWSLETTER DRAFTS
+# ===============================
+# Drafts for a whole call-for-action list are generated by one background
+# job: up to DRAFT_WORKERS at once, throttled to DRAFT_MAX_PER_MINUTE, each
+# item retried on its own with backoff. Every draft is a row in
+# `newsletter_drafts` with its status, so the page can show progress and a
+# failed item can be re-queued alone. A running draft records the job that
+# claimed it; if that job's process dies, the job is requeued once its lease
+# expires (see jobs.py) and takes its own running drafts back.
+
+DRAFT_WORKERS = int(os.getenv("DRAFT_WORKERS", "4"))
+DRAFT_MAX_PER_MINUTE = int(os.getenv("DRAFT_MAX_PER_MINUTE", "60"))
+DRAFT_ATTEMPTS = 3
+DRAFT_BACKOFF = 2.0         # seconds, doubled after each failed attempt
+
+_limiter = RateLimiter(DRAFT_MAX_PER_MINUTE)
+
+_DRAFT_COLUMNS = "d.id, d.lead_id, d.chat_id, d.status, d.subject, d.body, d.attempts, d.error, c.name, c.email"
+
+
+def _as_dict(row):
+    return {
+        "id": row[0],
+        "lead_id": row[1],
+        "chat_id": row[2],
+        "status": row[3],
+        "subject": row[4],
+        "body": row[5],
+        "attempts": row[6],
+        "error": row[7],
+        "company_name": row[8],
+        "email": row[9],
+    }
+
+
+def create_batch(user, chat_id=None, lead_ids=None):
+    """Queue drafts for a project's CTA leads (or the given lead ids).
+
+    Leads that already have a finished draft are skipped. Returns
+    (job_id, queued_count); job_id is None when nothing needed drafting.
+    """
+    conn = get_db_connection()
+
+    query = """
+        SELECT c.id, c.chat_id
+        FROM companies c
+        JOIN chats ch ON ch.id = c.chat_id
+        WHERE ch.user = ? AND c.status = 'cta'
+    """
+    params = [user]
+    if chat_id is not None:
+        query += " AND c.chat_id = ?"
+        params.append(chat_id)
+    if lead_ids:
+        query += f" AND c.id IN ({','.join('?' * len(lead_ids))})"
+        params.extend(lead_ids)
+
+    leads = conn.execute(query, params).fetchall()
+    if not leads:
+        conn.close()
+        return None, 0
+
+    cur = conn.cursor()
+    cur.executemany("""
+        INSERT INTO newsletter_drafts (user, chat_id, lead_id, status)
+        VALUES (?, ?, ?, 'pending')
+        ON CONFLICT(chat_id, lead_id) DO UPDATE SET
+            status = 'pending', error = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE status = 'failed'
+    """, [(user, lead_chat_id, lead_id) for lead_id, lead_chat_id in leads])
+
+    placeholders = ",".join("?" * len(leads))
+    pending = [r[0] for r in cur.execute(
+        f"SELECT id FROM newsletter_drafts WHERE lead_id IN ({placeholders}) AND status = 'pending'",
+        [lead_id for lead_id, _ in leads]
+    )]
+    conn.commit()
+    conn.close()
+
+    if not pending:
+        return None, 0
+
+    job_id = jobs.enqueue("newsletter_drafts", {"draft_ids": pending}, user=user, chat_id=chat_id)
+    return job_id, len(pending)
+
+
+def retry(user, draft_id):
+    """Re-queue a single failed draft; returns the job id (None if not retryable)."""
+    conn = get_db_connection()
+    row = conn.execute(
+        "SELECT chat_id FROM newsletter_drafts WHERE id = ? AND user = ? AND status = 'failed'",
+        (draft_id, user)
+    ).fetchone()
+    if not row:
+        conn.close()
+        return None
+
+    conn.execute(
+        "UPDATE newsletter_drafts SET status = 'pending', error = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+        (draft_id,)
+    )
+    conn.commit()
+    conn.close()
+
+    return jobs.enqueue("newsletter_drafts", {"draft_ids": [draft_id]}, user=user, chat_id=row[0])
+
+
+def list_drafts(user, chat_id):
+    conn = get_db_connection()
+    rows = conn.execute(f"""
+        SELECT {_DRAFT_COLUMNS}
+        FROM newsletter_drafts d
+        JOIN companies c ON c.id = d.lead_id
+        WHERE d.user = ? AND d.chat_id = ?
+        ORDER BY d.id
+    """, (user, chat_id)).fetchall()
+    conn.close()
+    return [_as_dict(r) for r in rows]
+
+
+def _load_items(job_id, draft_ids):
+    """Pending drafts, plus this job's own running ones from a run that died."""
+    conn = get_db_connection()
+    placeholders = ",".join("?" * len(draft_ids))
+    rows = conn.execute(f"""
+        SELECT d.id, ch.title, p.description, c.name, c.description
+        FROM newsletter_drafts d
+        JOIN companies c ON c.id = d.lead_id
+        JOIN chats ch ON ch.id = d.chat_id
+        LEFT JOIN products p ON p.chat_id = d.chat_id
+        WHERE d.id IN ({placeholders})
+          AND (d.status = 'pending' OR (d.status = 'running' AND d.job_id = ?))
+    """, [*draft_ids, job_id]).fetchall()
+    conn.close()
+    return rows
+
+
+def _claim(job_id, draft_id):
+    """Mark a draft running for job_id; False if another job already took it."""
+    conn = get_db_connection()
+    claimed = conn.execute(
+        "UPDATE newsletter_drafts SET status = 'running', job_id = ?, updated_at = CURRENT_TIMESTAMP "
+        "WHERE id = ? AND (status = 'pending' OR (status = 'running' AND job_id = ?))",
+        (job_id, draft_id, job_id)
+    ).rowcount
+    conn.commit()
+    conn.close()
+    return claimed == 1
+
+
+def _set_status(draft_id, status, subject=None, body=None, error=None, attempts=0):
+    conn = get_db_connection()
+    conn.execute("""
+        UPDATE newsletter_drafts
+        SET status = ?, subject = COALESCE(?, subject), body = COALESCE(?, body),
+            error = ?, attempts = attempts + ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    """, (status, subject, body, error, attempts, draft_id))
+    conn.commit()
+    conn.close()
+
+
+def _draft_one(job_id, item):
+    draft_id, project_title, project_description, company_name, company_description = item
+    if not _claim(job_id, draft_id):
+        return None
+
+    delay = DRAFT_BACKOFF
+    for attempt in range(1, DRAFT_ATTEMPTS + 1):
+        _limiter.acquire()
+        try:
+            draft = generate_newsletter_draft(
+                project_title, project_description or "",
+                company_name, company_description or "",
+                strict=True
+            )
+            _set_status(draft_id, "done", draft["subject"], draft["body"], attempts=attempt)
+            return True
+        except Exception as e:
+            error = str(e) or repr(e)
+            print(f"Draft {draft_id} attempt {attempt} failed:", error)
+            if attempt < DRAFT_ATTEMPTS:
+                time.sleep(delay)
+                delay *= 2
+
+    _set_status(draft_id, "failed", error=error, attempts=DRAFT_ATTEMPTS)
+    return False
+
+
+@jobs.register("newsletter_drafts")
+def run_batch(job_id, payload):
+    items = _load_items(job_id, payload["draft_ids"])
+    progress = {"total": len(items), "done": 0, "failed": 0}
+    jobs.update_progress(job_id, progress)
+
+    with ThreadPoolExecutor(max_workers=DRAFT_WORKERS, thread_name_prefix="draft") as pool:
+        for ok in pool.map(lambda item: _draft_one(job_id, item), items):
+            if ok is None:
+                progress["total"] -= 1
+            else:
+                progress["done" if ok else "failed"] += 1
+            jobs.update_progress(job_id, progress)
+
+    return progress
@@ -0,0 +1,119 @@
+import db
+from db import get_db_connection
+
+# ===============================
+# PROJECT READS
+# ===============================
+# Read queries over a user's projects (`chats` plus their `products` row),
+# shared by the pages that list projects. Each function is one indexed query;
+# per-project data is fetched with a join and grouped in Python, never with a
+# query per project. Single-project lookups are memoized for the request.
+
+
+def user_projects(user):
+    """[(chat_id, title, description)] for a user's projects, newest first."""
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT ch.id, ch.title, p.description
+        FROM chats ch
+        LEFT JOIN products p ON ch.id = p.chat_id
+        WHERE ch.user = ?
+        ORDER BY ch.id DESC
+    """, (user,)).fetchall()
+    conn.close()
+    return rows
+
+
+def _project_row(chat_id):
+    # one read serves both the project and its product fields for the request
+    def load():
+        conn = get_db_connection()
+        row = conn.execute("""
+            SELECT ch.user, ch.title, p.description, p.product_name, p.industry_suggestions,
+                   ch.lead_threshold
+            FROM chats ch
+            LEFT JOIN products p ON ch.id = p.chat_id
+            WHERE ch.id = ?
+        """, (chat_id,)).fetchone()
+        conn.close()
+        return row
+
+    return db.memo("project", chat_id, load)
+
+
+def get_project(chat_id):
+    """(user, title, description) of one project, or None."""
+    row = _project_row(chat_id)
+    return row[:3] if row else None
+
+
+def get_product(chat_id):
+    """(product_name, description, industry_suggestions) of a project's product row."""
+    row = _project_row(chat_id)
+    if not row or (row[2] is None and row[3] is None and row[4] is None):
+        return None, None, None
+    return row[3], row[2], row[4]
+
+
+def lead_threshold(chat_id):
+    """The project's own lead target, or None to use the default."""
+    row = _project_row(chat_id)
+    return row[5] if row else None
+
+
+def lead_count(chat_id):
+    """How many of a project's leads still count towards its target (declined ones do not)."""
+    conn = get_db_connection()
+    count = conn.execute("""
+        SELECT COUNT(*) FROM project_leads
+        WHERE chat_id = ? AND (status IS NULL OR status != 'declined')
+    """, (chat_id,)).fetchone()[0]
+    conn.close()
+    return count
+
+
+def forget(chat_id):
+    """Drop the request's cached copy after the project or its product changed."""
+    db.forget("project", chat_id)
+
+
+def owned_project(chat_id, user):
+    """get_project(chat_id) if it belongs to user, else None."""
+    row = get_project(chat_id)
+    return row if row and row[0] == user else None
+
+
+def cta_leads_by_project(user):
+    """A user's call-for-action leads grouped by project.
+
+    Returns [{"id", "title", "description", "companies": [...]}], newest
+    project first and newest lead first; projects without CTA leads are left
+    out. One join over every project, grouped as the rows stream in.
+    """
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT ch.id, ch.title, p.description,
+               c.id, c.name, c.description, c.rating, c.email, c.phone, c.address, c.website
+        FROM chats ch
+        JOIN companies c ON c.chat_id = ch.id AND c.status = 'cta'
+        LEFT JOIN products p ON ch.id = p.chat_id
+        WHERE ch.user = ?
+        ORDER BY ch.id DESC, c.id DESC
+    """, (user,))
+
+    projects = []
+    for r in rows:
+        if not projects or projects[-1]["id"] != r[0]:
+            projects.append({"id": r[0], "title": r[1], "description": r[2], "companies": []})
+        projects[-1]["companies"].append({
+            "id": r[3],
+            "name": r[4],
+            "description": r[5],
+            "rating": r[6],
+            "email": r[7],
+            "phone": r[8],
+            "address": r[9],
+            "website": r[10],
+        })
+    conn.close()
+    return projects
@@ -0,0 +1,244 @@
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from db import BASE_DIR, get_db_connection
+
+# ===============================
+# LOCAL RELEVANCE INDEX
+# ===============================
+# Every company in the global store is embedded with TF-IDF + truncated SVD
+# (LSA) into a row of an L2-normalized float32 matrix persisted next to
+# leads.db. Relevance is a single matrix-vector cosine product against the
+# project description. New/updated companies are folded in with the fitted
+# model; the model is refit once too much of the index was added that way.
+
+INDEX_PATH = os.path.join(BASE_DIR, "relevance_index.npz")
+MODEL_PATH = os.path.join(BASE_DIR, "relevance_model.pkl")
+
+SVD_DIMENSIONS = 128
+SVD_MIN_DOCS = 50           # below this the raw TF-IDF space is used
+REFIT_RATIO = 0.25          # refit once this share of rows was folded in
+
+_lock = threading.Lock()
+_index = None
+
+
+def _entity_text(name, description, address):
+    # the name counts double: it is often the only signal for sparse listings
+    return f"{name or ''} {name or ''} {description or ''} {address or ''}"
+
+
+def _fit(texts):
+    vectorizer = TfidfVectorizer(
+        sublinear_tf=True,
+        stop_words="english",
+        ngram_range=(1, 2),
+        min_df=1,
+        max_features=50000,
+        dtype=np.float32,
+    )
+    tfidf = vectorizer.fit_transform(texts)
+
+    svd = None
+    if len(texts) >= SVD_MIN_DOCS:
+        dims = min(SVD_DIMENSIONS, len(texts) - 1, tfidf.shape[1] - 1)
+        svd = TruncatedSVD(n_components=dims, random_state=0).fit(tfidf)
+    return vectorizer, svd
+
+
+def _transform(model, texts):
+    vectorizer, svd = model
+    vectors = vectorizer.transform(texts)
+    vectors = svd.transform(vectors) if svd is not None else vectors.toarray()
+    vectors = vectors.astype(np.float32)
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _save(index):
+    np.savez(
+        INDEX_PATH,
+        ids=index["ids"],
+        matrix=index["matrix"],
+        built_at=np.array(index["built_at"]),
+        boundary=index["boundary"],
+        folded=np.array(index["folded"]),
+        fitted_at=np.array(index["fitted_at"]),
+    )
+    with open(MODEL_PATH, "wb") as f:
+        pickle.dump(index["model"], f)
+
+
+def _load():
+    if not (os.path.exists(INDEX_PATH) and os.path.exists(MODEL_PATH)):
+        return None
+    try:
+        data = np.load(INDEX_PATH)
+        with open(MODEL_PATH, "rb") as f:
+            model = pickle.load(f)
+        return {
+            "ids": data["ids"],
+            "matrix": data["matrix"],
+            "built_at": str(data["built_at"]),
+            "boundary": data["boundary"],
+            "folded": int(data["folded"]),
+            "fitted_at": float(data["fitted_at"]),
+            "model": model,
+        }
+    except Exception as e:
+        print("Relevance index load error:", e)
+        return None
+
+
+def _boundary(rows):
+    """Newest updated_at among rows plus the ids stamped with it.
+
+    Timestamps have one-second resolution, so the next refresh re-reads that
+    second and skips the ids it has already seen.
+    """
+    built_at = max(r[4] or "" for r in rows)
+    ids = [r[0] for r in rows if (r[4] or "") == built_at]
+    return built_at, np.array(ids, dtype=np.int64)
+
+
+def _rebuild(conn):
+    rows = conn.execute(
+        "SELECT id, name, description, address, updated_at FROM company_entities ORDER BY id"
+    ).fetchall()
+    if not rows:
+        return None
+
+    texts = [_entity_text(r[1], r[2], r[3]) for r in rows]
+    model = _fit(texts)
+    built_at, boundary = _boundary(rows)
+    return {
+        "ids": np.array([r[0] for r in rows], dtype=np.int64),
+        "matrix": _transform(model, texts),
+        "built_at": built_at,
+        "boundary": boundary,
+        "folded": 0,
+        "fitted_at": time.time(),
+        "model": model,
+    }
+
+
+def _refresh(conn, index):
+    """Fold rows changed since built_at into the index; refit when needed."""
+    changed = conn.execute(
+        "SELECT id, name, description, address, updated_at FROM company_entities WHERE updated_at >= ? ORDER BY id",
+        (index["built_at"],)
+    ).fetchall()
+    seen = set(index["boundary"].tolist())
+    changed = [r for r in changed if not ((r[4] or "") == index["built_at"] and r[0] in seen)]
+    if not changed:
+        return index, False
+
+    folded = index["folded"] + len(changed)
+    if folded > REFIT_RATIO * max(len(index["ids"]), SVD_MIN_DOCS):
+        return _rebuild(conn), True
+
+    vectors = _transform(index["model"], [_entity_text(r[1], r[2], r[3]) for r in changed])
+    positions = index.get("positions") or {
+        entity_id: pos for pos, entity_id in enumerate(index["ids"].tolist())
+    }
+
+    ids = index["ids"]
+    matrix = index["matrix"]
+    new_ids, new_rows = [], []
+    for r, vec in zip(changed, vectors):
+        pos = positions.get(r[0])
+        if pos is None:
+            new_ids.append(r[0])
+            new_rows.append(vec)
+        else:
+            matrix[pos] = vec
+
+    if new_ids:
+        ids = np.concatenate([ids, np.array(new_ids, dtype=np.int64)])
+        matrix = np.vstack([matrix, np.array(new_rows, dtype=np.float32)])
+
+    built_at, boundary = _boundary(changed)
+    if built_at == index["built_at"]:
+        boundary = np.concatenate([index["boundary"], boundary])
+    return {
+        "ids": ids,
+        "matrix": matrix,
+        "built_at": built_at,
+        "boundary": boundary,
+        "folded": folded,
+        "fitted_at": index["fitted_at"],
+        "model": index["model"],
+    }, True
+
+
+def ensure_index():
+    """Return the up-to-date in-memory index (None while the store is empty)."""
+    global _index
+
+    with _lock:
+        conn = get_db_connection()
+        try:
+            index = _index or _load()
+            if index is None:
+                index, dirty = _rebuild(conn), True
+            else:
+                index, dirty = _refresh(conn, index)
+        finally:
+            conn.close()
+
+        if index is not None and (dirty or "positions" not in index):
+            index["positions"] = {entity_id: pos for pos, entity_id in enumerate(index["ids"].tolist())}
+            if dirty:
+                _save(index)
+        _index = index
+        return index
+
+
+def embed(texts):
+    """Embed free text (e.g. project descriptions) into the index space.
+
+    Returns (vectors, model_version); vectors from different model versions
+    are not comparable. (None, None) while the company store is empty.
+    """
+    index = ensure_index()
+    if index is None or not texts:
+        return None, None
+    return _transform(index["model"], texts), index["fitted_at"]
+
+
+def model_version():
+    """Identifier of the fitted model; changes whenever the index is refit."""
+    index = ensure_index()
+    return index["fitted_at"] if index is not None else None
+
+
+def score_entities(query_text, entity_ids):
+    """Cosine similarity of query_text to each entity id (0.0 if unindexed)."""
+    index = ensure_index()
+    if index is None or not entity_ids:
+        return np.zeros(len(entity_ids), dtype=np.float32)
+
+    query = _transform(index["model"], [query_text])[0]
+
+    positions = index["positions"]
+    rows = np.array([positions.get(e, -1) for e in entity_ids])
+
+    scores = np.zeros(len(entity_ids), dtype=np.float32)
+    known = rows >= 0
+    scores[known] = index["matrix"][rows[known]] @ query
+    return scores
+
+
+def rank_entities(query_text, entity_ids, top_k, min_score=0.0):
+    """Return [(position_in_entity_ids, score)] best first, at most top_k."""
+    scores = score_entities(query_text, entity_ids)
+    order = np.argsort(-scores, kind="stable")[:top_k]
+    return [(int(i), float(scores[i])) for i in order if scores[i] >= min_score]
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import re
+import threading
+import time
+
+from db import get_db_connection
+
+# ===============================
+# PERSISTENT RESPONSE CACHE
+# ===============================
+# Upstream API responses are stored in a SQLite table keyed on a hash of the
+# normalized request. Each row stores its expiry (per-namespace TTL, e.g. by
+# SerpAPI engine, else the default); expired rows are purged and the least
+# recently used ones are evicted once the table passes max_entries.
+# Concurrent identical requests are coalesced onto a single upstream call.
+# Cache tables are created by migrations.py.
+
+EVICT_EVERY = 50
+
+
+class _InFlight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+
+    def __init__(self, table, default_ttl, ttls=None, max_entries=5000,
+                 ignore_params=("api_key",), query_params=("q",)):
+        self.table = table
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+        self.max_entries = max_entries
+        self.ignore_params = set(ignore_params)
+        self.query_params = set(query_params)
+
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def make_key(self, namespace, params):
+        """Hash params after dropping secrets and normalizing the query text.
+
+        Only query_params get case/whitespace folding; other values (e.g.
+        pagination tokens) can be case-sensitive and are kept as given.
+        """
+        normalized = {}
+        for k, v in params.items():
+            if k in self.ignore_params or v is None:
+                continue
+            if k in self.query_params and isinstance(v, str):
+                v = re.sub(r"\s+", " ", v).strip().lower()
+            normalized[k] = v
+
+        raw = json.dumps([namespace, normalized], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, namespace, key):
+        now = time.time()
+
+        conn = get_db_connection()
+        row = conn.execute(
+            f"SELECT value, created_at, expires_at FROM {self.table} WHERE key=?",
+            (key,)
+        ).fetchone()
+
+        # rows written before expires_at existed fall back to the namespace TTL
+        if row and now <= (row[2] if row[2] is not None else row[1] + self._ttl(namespace)):
+            conn.execute(f"UPDATE {self.table} SET accessed_at=? WHERE key=?", (now, key))
+            conn.commit()
+            conn.close()
+            return json.loads(row[0])
+
+        conn.close()
+        return None
+
+    def _ttl(self, namespace):
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def set(self, namespace, key, value):
+        now = time.time()
+
+        conn = get_db_connection()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, namespace, value, created_at, accessed_at, expires_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, namespace, json.dumps(value), now, now, now + self._ttl(namespace))
+        )
+        conn.commit()
+        conn.close()
+
+        with self._lock:
+            self._writes += 1
+            should_evict = self._writes % EVICT_EVERY == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """Drop expired rows, then the least recently used ones over max_entries."""
+        now = time.time()
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        removed = cur.execute(
+            f"DELETE FROM {self.table} WHERE expires_at < ?", (now,)
+        ).rowcount
+        # rows from before expires_at existed: drop once past the longest TTL
+        longest = max([self.default_ttl, *self.ttls.values()])
+        removed += cur.execute(
+            f"DELETE FROM {self.table} WHERE expires_at IS NULL AND created_at < ?",
+            (now - longest,)
+        ).rowcount
+
+        total = cur.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if total > self.max_entries:
+            removed += cur.execute(f"""
+                DELETE FROM {self.table} WHERE key IN (
+                    SELECT key FROM {self.table} ORDER BY accessed_at ASC LIMIT ?
+                )
+            """, (total - self.max_entries,)).rowcount
+
+        conn.commit()
+        conn.close()
+
+        with self._lock:
+            self._stats["evictions"] += removed
+
+    def fetch(self, namespace, params, loader, cacheable=None):
+        """Return the cached response for params, calling loader() on a miss.
+
+        Only one loader runs per key at a time; other callers wait for it.
+        cacheable(value) can veto storing a response (e.g. API errors).
+        """
+        key = self.make_key(namespace, params)
+
+        value = self.get(namespace, key)
+        if value is not None:
+            with self._lock:
+                self._stats["hits"] += 1
+            return value
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _InFlight()
+                self._stats["misses"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            if cacheable is None or cacheable(flight.value):
+                self.set(namespace, key, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = round((stats["hits"] + stats["coalesced"]) / lookups, 3) if lookups else 0.0
+        return stats
@@ -1,13 +1,28 @@
-import sqlite3
+import sys
 
-conn = sqlite3.connect("leads.db")
-cur = conn.cursor()
+from migrations import migrate, check_query_plans, check_upgrade_path
 
-try:
-    cur.execute("ALTER TABLE companies ADD COLUMN chat_id INTEGER")
-    print("✅ chat_id column added successfully.")
-except Exception as e:
-    print("⚠️ Maybe column already exists:", e)
+# Usage:
+#   python update_db.py           apply pending schema migrations
+#   python update_db.py --check   also fail if upgrading a legacy database breaks
+#                                 or a hot query does a full table scan
 
-conn.commit()
-conn.close()
+applied = migrate()
+print(f"✅ Schema up to date ({len(applied)} migration(s) applied).")
+
+if "--check" in sys.argv:
+    error = check_upgrade_path()
+    if error:
+        print("⚠️ Upgrading a legacy database failed:", error)
+        sys.exit(1)
+    print("✅ Legacy databases upgrade cleanly.")
+
+    problems = check_query_plans()
+    for name, plan in problems.items():
+        print(f"⚠️ Full table scan in '{name}':")
+        for line in plan:
+            print("   ", line)
+
+    if problems:
+        sys.exit(1)
+    print("✅ All hot queries use indexes.")